@@ -0,0 +1,30 @@
+"""add composite lookup indexes for conversations and messages"""
+
+from alembic import op
+
+
+revision = "202511201000"
+down_revision = "90fbfd38b17e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # list_conversations: WHERE client_id = ? ORDER BY last_accessed_at DESC
+    op.create_index(
+        "idx_conversation_client_accessed",
+        "conversations",
+        ["client_id", "last_accessed_at"],
+    )
+    # fetch_messages / get_conversation: WHERE conversation_id = ?
+    # ORDER BY created_at, id
+    op.create_index(
+        "idx_message_conversation_created",
+        "messages",
+        ["conversation_id", "created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_message_conversation_created", table_name="messages")
+    op.drop_index("idx_conversation_client_accessed", table_name="conversations")
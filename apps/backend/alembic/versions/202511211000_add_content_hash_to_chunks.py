@@ -0,0 +1,24 @@
+"""add content_hash to chunks"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "202511211000"
+down_revision = "202511201000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chunks", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_chunks_content_hash"), "chunks", ["content_hash"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_chunks_content_hash"), table_name="chunks")
+    op.drop_column("chunks", "content_hash")
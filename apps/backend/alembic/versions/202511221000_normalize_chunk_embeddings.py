@@ -0,0 +1,31 @@
+"""normalize stored chunk embeddings to unit length"""
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+revision = "202511221000"
+down_revision = "202511211000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Similarity search scores stored embeddings with a plain dot product,
+    # which requires every row to be unit-norm
+    connection = op.get_bind()
+    rows = connection.execute(sa.text("SELECT id, embedding FROM chunks"))
+    for chunk_id, embedding in rows.fetchall():
+        vector = np.frombuffer(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if abs(norm - 1.0) > 1e-4:
+            connection.execute(
+                sa.text("UPDATE chunks SET embedding = :embedding WHERE id = :id"),
+                {"embedding": (vector / (norm + 1e-10)).tobytes(), "id": chunk_id},
+            )
+
+
+def downgrade() -> None:
+    # Original magnitudes are not recoverable; unit-norm rows stay valid
+    pass
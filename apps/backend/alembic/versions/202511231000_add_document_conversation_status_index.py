@@ -0,0 +1,25 @@
+"""add (conversation_id, status) index to documents"""
+
+from alembic import op
+
+
+revision = "202511231000"
+down_revision = "202511221000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # similarity search / duplicate checks: WHERE conversation_id = ?
+    # AND status = 'ready'
+    op.create_index(
+        "idx_document_conversation_status",
+        "documents",
+        ["conversation_id", "status"],
+    )
+    # Refresh planner statistics so the new index is picked up
+    op.execute("ANALYZE")
+
+
+def downgrade() -> None:
+    op.drop_index("idx_document_conversation_status", table_name="documents")
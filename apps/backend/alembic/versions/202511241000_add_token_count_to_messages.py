@@ -0,0 +1,24 @@
+"""add persisted token counts to messages"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "202511241000"
+down_revision = "202511231000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows stay NULL and are counted on demand
+    op.add_column("messages", sa.Column("token_count", sa.Integer(), nullable=True))
+    op.add_column(
+        "messages",
+        sa.Column("token_count_tokenizer", sa.String(length=255), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "token_count_tokenizer")
+    op.drop_column("messages", "token_count")
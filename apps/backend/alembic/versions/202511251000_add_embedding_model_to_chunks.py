@@ -0,0 +1,21 @@
+"""record the embedding model on chunks"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "202511251000"
+down_revision = "202511241000"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows stay NULL: their model is unknown, so they are never reused
+    op.add_column(
+        "chunks", sa.Column("embedding_model", sa.String(length=255), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("chunks", "embedding_model")
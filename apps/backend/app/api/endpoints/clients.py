@@ -31,8 +31,8 @@ async def get_client(client_id: str):
                 repetition_penalty=client.repetition_penalty,
                 do_sample=client.do_sample,
                 max_tokens=client.max_tokens,
-                created_at=client.created_at.isoformat(),
-                updated_at=client.updated_at.isoformat(),
+                created_at=client.created_at,
+                updated_at=client.updated_at,
             )
     except HTTPException:
         raise
@@ -82,7 +82,6 @@ async def update_client(client_id: str, client_data: ClientUpdate):
                 client.max_tokens = client_data.max_tokens
 
             await session.commit()
-            await session.refresh(client)
 
             return ClientResponse(
                 id=client.id,
@@ -94,8 +93,8 @@ async def update_client(client_id: str, client_data: ClientUpdate):
                 repetition_penalty=client.repetition_penalty,
                 do_sample=client.do_sample,
                 max_tokens=client.max_tokens,
-                created_at=client.created_at.isoformat(),
-                updated_at=client.updated_at.isoformat(),
+                created_at=client.created_at,
+                updated_at=client.updated_at,
             )
     except HTTPException:
         raise
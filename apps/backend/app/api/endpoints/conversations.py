@@ -9,6 +9,7 @@ from ...db.conversation_helpers import (
 )
 from ...db.models import Conversation, Message
 from ...db.session import async_session
+from ...rag.vector_store import VectorStore
 from ...services.model_utils import get_or_create_client
 from ...schemas import (
     ConversationCreate,
@@ -44,9 +45,9 @@ async def list_conversations(client_id: str = Query(...)):
                     ConversationResponse(
                         id=conversation.id,
                         title=conversation.title,
-                        created_at=conversation.created_at.isoformat(),
-                        updated_at=conversation.updated_at.isoformat(),
-                        last_accessed_at=conversation.last_accessed_at.isoformat(),
+                        created_at=conversation.created_at,
+                        updated_at=conversation.updated_at,
+                        last_accessed_at=conversation.last_accessed_at,
                         message_count=message_count,
                     )
                 )
@@ -72,14 +73,13 @@ async def create_conversation(conversation_data: ConversationCreate):
             )
             session.add(conversation)
             await session.commit()
-            await session.refresh(conversation)
 
             return ConversationResponse(
                 id=conversation.id,
                 title=conversation.title,
-                created_at=conversation.created_at.isoformat(),
-                updated_at=conversation.updated_at.isoformat(),
-                last_accessed_at=conversation.last_accessed_at.isoformat(),
+                created_at=conversation.created_at,
+                updated_at=conversation.updated_at,
+                last_accessed_at=conversation.last_accessed_at,
                 message_count=0,
             )
     except Exception as e:
@@ -123,15 +123,15 @@ async def get_conversation(conversation_id: str, client_id: str = Query(...)):
             return ConversationDetailResponse(
                 id=conversation.id,
                 title=conversation.title,
-                created_at=conversation.created_at.isoformat(),
-                updated_at=conversation.updated_at.isoformat(),
-                last_accessed_at=conversation.last_accessed_at.isoformat(),
+                created_at=conversation.created_at,
+                updated_at=conversation.updated_at,
+                last_accessed_at=conversation.last_accessed_at,
                 messages=[
                     MessageResponse(
                         role=msg.role,
                         content=msg.content,
                         thinking=msg.thinking,
-                        created_at=msg.created_at.isoformat(),
+                        created_at=msg.created_at,
                     )
                     for msg in messages
                 ],
@@ -175,7 +175,6 @@ async def update_conversation(
             # Update title
             conversation.title = conversation_data.title
             await session.commit()
-            await session.refresh(conversation)
 
             # Get message count
             count_result = await session.execute(
@@ -188,9 +187,9 @@ async def update_conversation(
             return ConversationResponse(
                 id=conversation.id,
                 title=conversation.title,
-                created_at=conversation.created_at.isoformat(),
-                updated_at=conversation.updated_at.isoformat(),
-                last_accessed_at=conversation.last_accessed_at.isoformat(),
+                created_at=conversation.created_at,
+                updated_at=conversation.updated_at,
+                last_accessed_at=conversation.last_accessed_at,
                 message_count=message_count,
             )
     except HTTPException:
@@ -223,7 +222,9 @@ async def delete_conversation(conversation_id: str, client_id: str = Query(...))
                     detail="Conversation does not belong to this client",
                 )
 
-            # Delete conversation (cascade will delete messages)
+            # Delete conversation (cascade will delete messages and chunks);
+            # the chunks' KNN vectors live outside the cascade
+            await VectorStore(session).delete_conversation_vectors(conversation.id)
             await session.delete(conversation)
             await session.commit()
 
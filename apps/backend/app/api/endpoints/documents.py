@@ -13,12 +13,7 @@ from ...db.session import async_session
 from ...services.model_utils import get_or_create_client
 from ...rag.config import RAGConfig
 from ...schemas import DocumentResponse
-from ...services.document_events import (
-    broadcast,
-    get_history,
-    subscribe,
-    unsubscribe,
-)
+from ...services.document_events import broadcast, subscribe, unsubscribe
 from ...services.document_service import process_document_background
 
 router = APIRouter()
@@ -101,7 +96,6 @@ async def upload_document(
             )
             session.add(document)
             await session.commit()
-            await session.refresh(document)
 
             # Notify any SSE listeners that processing has started
             await broadcast(
@@ -131,7 +125,7 @@ async def upload_document(
                 filename=document.filename,
                 status=document.status,
                 chunk_count=document.chunk_count,
-                upload_timestamp=document.upload_timestamp.isoformat(),
+                upload_timestamp=document.upload_timestamp,
                 error_message=document.error_message,
                 sse_url=f"/api/conversations/{conversation_id}/documents/{document_id}/events?client_id={client_id}",
             )
@@ -178,7 +172,7 @@ async def list_documents(conversation_id: str, client_id: str = Query(...)):
                     filename=doc.filename,
                     status=doc.status,
                     chunk_count=doc.chunk_count,
-                    upload_timestamp=doc.upload_timestamp.isoformat(),
+                    upload_timestamp=doc.upload_timestamp,
                     error_message=doc.error_message,
                     sse_url=f"/api/conversations/{conversation_id}/documents/{doc.id}/events?client_id={client_id}",
                 )
@@ -229,23 +223,22 @@ async def stream_document_events(
             raise HTTPException(status_code=404, detail="Document not found")
 
     async def event_stream(request_obj: Request):
-        queue = await subscribe(document_id)
+        # The first batch replays recent history so clients see stage events
+        # even if they subscribe late
+        subscription = subscribe(document_id)
         try:
             # Send initial snapshot
             yield f"data: {json.dumps({'type': 'status', 'status': doc.status, 'document_id': document_id, 'chunk_count': doc.chunk_count, 'filename': doc.filename, 'conversation_id': conversation_id})}\n\n"
-            # Replay recent history so clients see stage events even if they subscribe late
-            for ev in get_history(document_id):
-                yield f"data: {json.dumps(ev)}\n\n"
             while True:
                 if await request_obj.is_disconnected():
                     break
-                try:
-                    event = await asyncio.wait_for(queue.get(), timeout=15)
-                except asyncio.TimeoutError:
-                    event = {"type": "heartbeat", "document_id": document_id}
-                yield f"data: {json.dumps(event)}\n\n"
+                events = await subscription.next_events(timeout=15)
+                if not events:
+                    events = [{"type": "heartbeat", "document_id": document_id}]
+                for event in events:
+                    yield f"data: {json.dumps(event)}\n\n"
         finally:
-            unsubscribe(document_id, queue)
+            unsubscribe(subscription)
 
     return StreamingResponse(
         event_stream(request),
@@ -51,6 +51,9 @@ class Client(Base):
         back_populates="client", cascade="all, delete-orphan"
     )
 
+    # Fetch server-generated timestamps via RETURNING on INSERT/UPDATE
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class Conversation(Base):
     __tablename__ = "conversations"
@@ -83,6 +86,12 @@ class Conversation(Base):
         back_populates="conversation", cascade="all, delete-orphan"
     )
 
+    # Covers the per-client listing ordered by most recent access
+    __table_args__ = (
+        Index("idx_conversation_client_accessed", "client_id", "last_accessed_at"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -97,12 +106,25 @@ class Message(Base):
     role: Mapped[str] = mapped_column(String(16), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     thinking: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Token count of the formatted message segment, valid only for the
+    # tokenizer named alongside it (models can change mid-conversation)
+    token_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    token_count_tokenizer: Mapped[str | None] = mapped_column(
+        String(255), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
     )
 
     conversation: Mapped["Conversation"] = relationship(back_populates="messages")
 
+    # Covers history reads ordered by (created_at, id) within a conversation
+    __table_args__ = (
+        Index(
+            "idx_message_conversation_created", "conversation_id", "created_at", "id"
+        ),
+    )
+
 
 class ModelConfig(Base):
     """Model configuration with thinking behavior metadata."""
@@ -204,6 +226,12 @@ class Document(Base):
         back_populates="document", cascade="all, delete-orphan"
     )
 
+    # Covers similarity search and duplicate checks over a conversation's
+    # ready documents
+    __table_args__ = (
+        Index("idx_document_conversation_status", "conversation_id", "status"),
+    )
+
 
 class Chunk(Base):
     """Text chunks with embeddings for vector search."""
@@ -220,6 +248,12 @@ class Chunk(Base):
     chunk_index: Mapped[int] = mapped_column(Integer, nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     chunk_metadata: Mapped[str] = mapped_column(Text, nullable=False)  # JSON string
+    # SHA-256 of the chunk text, for identifying repeated chunks
+    content_hash: Mapped[str | None] = mapped_column(
+        String(64), nullable=True, index=True
+    )
+    # Model that produced the embedding; vectors are only reused within one
+    embedding_model: Mapped[str | None] = mapped_column(String(255), nullable=True)
 
     # Vector embedding stored as blob (numpy array serialized)
     embedding: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 import sqlite3
 
 import sqlite_vec
@@ -9,6 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_asyn
 from .config import ASYNC_DATABASE_URL
 from .models import Base
 
+logger = logging.getLogger(__name__)
 
 engine = create_async_engine(
     ASYNC_DATABASE_URL,
@@ -17,10 +19,33 @@ engine = create_async_engine(
 )
 
 
+def load_sqlite_vec(dbapi_connection) -> None:
+    """Load sqlite-vec into a pysqlite or aiosqlite DBAPI connection.
+
+    aiosqlite hands SQLAlchemy an adapted connection whose sqlite3 handle
+    lives on the driver's own thread, so the extension is loaded there via
+    run_async. Failure (e.g. a Python built without extension loading) is
+    logged; vector search then falls back to NumPy.
+    """
+    try:
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            dbapi_connection.enable_load_extension(True)
+            sqlite_vec.load(dbapi_connection)
+            dbapi_connection.enable_load_extension(False)
+            return
+        dbapi_connection.run_async(lambda conn: conn.enable_load_extension(True))
+        dbapi_connection.run_async(
+            lambda conn: conn.load_extension(sqlite_vec.loadable_path())
+        )
+        dbapi_connection.run_async(lambda conn: conn.enable_load_extension(False))
+    except (AttributeError, sqlite3.Error) as e:
+        logger.warning("⚠️  Could not load sqlite-vec: %s", e)
+
+
 @event.listens_for(engine.sync_engine, "connect")
 def configure_sqlite(dbapi_connection, connection_record):
+    load_sqlite_vec(dbapi_connection)
     if isinstance(dbapi_connection, sqlite3.Connection):
-        sqlite_vec.load(dbapi_connection)
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
         cursor.close()
@@ -1,12 +1,16 @@
 import asyncio
 import contextlib
 import json
+import logging
+import os
+import re
 from contextlib import asynccontextmanager
 
 import torch
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select
+from transformers import StoppingCriteriaList
 
 from .api.endpoints import clients, conversations, documents, models
 from .db.conversation_helpers import (
@@ -16,27 +20,82 @@ from .db.conversation_helpers import (
 from .db.models import ModelConfig
 from .db.session import async_session, init_models
 from .services.model_utils import (
+    GENERATION_STOP_STRINGS,
     AsyncQueueTextStreamer,
+    LoadedModel,
+    StopWhenStreamerClosed,
     count_tokens_for_system_prompt,
     format_prompt,
-    format_prompt_with_rag,
+    format_prompt_ids,
     get_generation_params,
+    get_generation_slot,
     get_or_create_client,
+    is_model_loaded,
     load_model,
     persist_assistant_turn,
     persist_user_turn,
+    rag_user_message,
 )
+from .rag.chunker import TextChunker
 from .rag.config import RAGConfig
+from .rag.document_processor import DocumentProcessor
 from .rag.embeddings import EmbeddingGenerator
 from .rag.retriever import RAGRetriever
 from .rag.vector_store import VectorStore
 from .services.document_service import check_conversation_has_documents
 
-# ... imports ...
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
+# Stream parser tags, compiled once: each search returns the earliest tag in
+# a single scan instead of one str.find per tag.
+# Any <|im_start|> inside the reply opens a new turn; the role name may only
+# arrive in the next chunk when the tag is streamed as its own token.
+NEW_TURN_PATTERN = re.compile(r"<\|im_start\|>")
+THINK_CLOSE_PATTERN = re.compile(r"</think(?:ing)?>")
+RESPONSE_TAG_PATTERN = re.compile(r"<think(?:ing)?>|<\|im_end\|>")
+IM_END_TAG = "<|im_end|>"
+THINK_CLOSE_TAGS = ("</think>", "</thinking>")
+RESPONSE_TAGS = ("<think>", "<thinking>", IM_END_TAG)
+
+
+def find_next_tag(
+    text: str, pos: int, tags: tuple[str, ...], pattern: re.Pattern
+) -> tuple[int, int, str] | None:
+    """Return (start, end, tag) of the first tag at or after pos, or None.
+
+    Tags usually sit right at the cursor (e.g. <think> opening the reply), so
+    an O(len(tag)) startswith check runs before falling back to a scan.
+    """
+    for tag in tags:
+        if text.startswith(tag, pos):
+            return pos, pos + len(tag), tag
+    match = pattern.search(text, pos)
+    if match is None:
+        return None
+    return match.start(), match.end(), match.group()
+
 
 # Global RAG components (initialized at startup)
 rag_config: RAGConfig | None = None
 embedding_generator: EmbeddingGenerator | None = None
+# Background preload of the default generator model (started at startup)
+model_warmup_task: asyncio.Task | None = None
+
+
+def warm_rag_components(config: RAGConfig) -> EmbeddingGenerator:
+    """Load every lazily built RAG singleton so the first request doesn't pay for it."""
+    generator = EmbeddingGenerator.get_instance(config)
+    # First forward pass allocates device buffers and selects kernels
+    generator.generate_embedding("warmup")
+    # Loads the chunking tokenizer and splitters
+    TextChunker(chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap)
+    try:
+        DocumentProcessor.get_instance().warmup()
+    except Exception as e:
+        # Uploads still work; the first PDF just builds the pipeline itself
+        logger.warning("⚠️  Failed to warm up Docling pipeline: %s", e)
+    return generator
 
 
 async def init_rag_components():
@@ -54,9 +113,9 @@ async def init_rag_components():
             print(f"Top-k: {config.top_k}")
             print(f"Min similarity: {config.min_similarity}")
 
-            # Initialize embedding generator (loads model)
+            # Initialize embedding generator, chunker and Docling (loads models)
             # Run in thread pool to avoid blocking event loop
-            generator = await asyncio.to_thread(EmbeddingGenerator.get_instance, config)
+            generator = await asyncio.to_thread(warm_rag_components, config)
 
             print("✅ RAG components initialized successfully!")
             print(f"{'=' * 60}\n")
@@ -85,36 +144,35 @@ async def warmup_model_task():
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup and shutdown events.
-    Handles database initialization, RAG setup, and model warmup in parallel.
+    Handles database initialization and RAG setup in parallel; the generator
+    model warms up in the background so the server accepts connections early.
     """
     # --- Startup ---
     print("\n🚀 Starting up Baguettotron Backend...")
 
-    # Define tasks
-    tasks = [
-        init_models(),
-        init_rag_components(),
-        warmup_model_task(),
-    ]
+    global rag_config, embedding_generator, model_warmup_task
+    model_warmup_task = asyncio.create_task(warmup_model_task())
 
     # Run tasks concurrently
     print("⏳ Running startup tasks in parallel...")
-    results = await asyncio.gather(*tasks)
-
-    # Unpack results
-    # init_models returns None
-    # init_rag_components returns (config, generator)
-    # warmup_model_task returns None
-
-    global rag_config, embedding_generator
-    rag_config, embedding_generator = results[1]
+    _, (rag_config, embedding_generator) = await asyncio.gather(
+        init_models(),
+        init_rag_components(),
+    )
+    if embedding_generator:
+        # Index chunks stored before sqlite-vec search (or while it was
+        # unavailable); needs both the tables and the embedding dimension
+        async with async_session() as session:
+            await VectorStore(session).sync_vector_index(embedding_generator.dimension)
 
-    print("✨ All startup tasks completed!")
+    print("✨ Startup tasks completed! (generator model warming in background)")
 
     yield
 
     # --- Shutdown ---
     print("\n🛑 Shutting down Baguettotron Backend...")
+    if model_warmup_task and not model_warmup_task.done():
+        model_warmup_task.cancel()
     # Cleanup resources if needed
     # if embedding_generator:
     #     embedding_generator.unload()
@@ -152,6 +210,48 @@ async def health_check():
     return {"status": "ok", "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+def spawn_background(coro) -> asyncio.Task:
+    """Run a coroutine (or track a task) in the background, logging any failure."""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("Background task failed: %s", t.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def touch_conversation(conversation_id: str) -> None:
+    """Bump last_accessed_at using an independent session."""
+    async with async_session() as session:
+        await update_conversation_access_time(session, conversation_id)
+
+
+async def get_model_for_request(
+    websocket: WebSocket, model_name: str, conversation_id: str | None
+) -> LoadedModel:
+    """Return cached model data, telling the client to wait if it is still loading."""
+    if is_model_loaded(model_name):
+        return load_model(model_name)
+
+    await websocket.send_json({
+        "type": "warming",
+        "model": model_name,
+        "conversation_id": conversation_id,
+    })
+    # Let the startup preload finish first rather than loading the weights twice
+    if model_warmup_task and not model_warmup_task.done():
+        await asyncio.shield(model_warmup_task)
+    return await asyncio.to_thread(load_model, model_name)
+
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     await websocket.accept()
@@ -168,27 +268,20 @@ async def websocket_chat(websocket: WebSocket):
             client_id = message_data.get("client_id")
             conversation_id = message_data.get("conversation_id")
 
-            # Simple request logging
-            print(f"\n{'=' * 80}")
-            print("📨 NEW REQUEST")
-            print(f"{'=' * 80}")
-            print(f"Model: {model_name}")
-            print(f"Thinking mode: {thinking_mode}")
-            print(f"Message: {user_message}")
-            print(f"{'=' * 80}\n")
+            logger.info(
+                "📨 New request: model=%s thinking_mode=%s message_chars=%d",
+                model_name,
+                thinking_mode,
+                len(user_message),
+            )
 
             if not client_id:
                 client_id = websocket.client.host if websocket.client else "anonymous"
 
-            if not conversation_id:
-                print(
-                    "⚠️  Missing conversation_id in payload, will use default conversation."
-                )
-
-            # Load model
-            model_data = load_model(model_name)
-            model = model_data["model"]
-            tokenizer = model_data["tokenizer"]
+            # Load model (served from cache once warmed up)
+            loaded = await get_model_for_request(websocket, model_name, conversation_id)
+            model = loaded.model
+            tokenizer = loaded.tokenizer
 
             async with async_session() as session:
                 client = await get_or_create_client(session, client_id)
@@ -203,11 +296,15 @@ async def websocket_chat(websocket: WebSocket):
                 thinking_behavior = "controllable"
                 if model_config:
                     thinking_behavior = model_config.thinking_behavior
-                    print(f"📋 Model config found: {model_config.display_name}")
-                    print(f"   - thinking_behavior: {thinking_behavior}")
+                    logger.debug(
+                        "📋 Model config found: %s (thinking_behavior=%s)",
+                        model_config.display_name,
+                        thinking_behavior,
+                    )
                 else:
-                    print(
-                        f"⚠️  Model config not found for '{model_name}', using fallback: thinking_behavior='controllable'"
+                    logger.warning(
+                        "⚠️  Model config not found for '%s', using fallback: thinking_behavior='controllable'",
+                        model_name,
                     )
 
                 # Retrieve system prompt from client record
@@ -215,7 +312,7 @@ async def websocket_chat(websocket: WebSocket):
 
                 # Backward compatibility: if conversation_id is missing, get or create default
                 if conversation_id is None:
-                    print(
+                    logger.warning(
                         "⚠️  Missing conversation_id in payload, using default conversation."
                     )
                     conversation = await get_or_create_default_conversation(
@@ -224,53 +321,51 @@ async def websocket_chat(websocket: WebSocket):
                     conversation_id = conversation.id
                     await session.commit()
 
-                # Update conversation access time
-                await update_conversation_access_time(session, conversation_id)
+                # Release the write lock (e.g. a newly created client) before
+                # the background writers below open their own sessions
+                await session.commit()
+
+                # Update conversation access time off the request path
+                spawn_background(touch_conversation(conversation_id))
 
                 # Count system prompt tokens
                 system_prompt_tokens = count_tokens_for_system_prompt(
                     tokenizer, system_prompt
                 )
 
-                conversation_history = await persist_user_turn(
+                conversation_history, user_turn_write = await persist_user_turn(
                     session,
                     conversation_id,
                     user_message,
                     tokenizer,
                     system_prompt_tokens,
                 )
+                # Tracked so a failure is logged even if this request errors
+                # out before awaiting it below
+                spawn_background(user_turn_write)
 
                 # RAG Integration: Check for documents and retrieve context
                 rag_context = None
-                print("\n[RAG] eligibility checkpoint")
-                print(f"   conversation_id={conversation_id}")
-                print(f"   rag_config_loaded={bool(rag_config)}")
-                print(f"   rag_enabled={rag_config.enabled if rag_config else False}")
-                print(f"   embedding_generator_ready={embedding_generator is not None}")
+                logger.debug(
+                    "[RAG] eligibility checkpoint: conversation_id=%s config_loaded=%s "
+                    "enabled=%s embedding_generator_ready=%s",
+                    conversation_id,
+                    bool(rag_config),
+                    rag_config.enabled if rag_config else False,
+                    embedding_generator is not None,
+                )
                 if rag_config and rag_config.enabled and embedding_generator:
                     try:
                         # Check if conversation has ready documents
-                        # Note: check_conversation_has_documents was moved to document_service, but I imported it from there?
-                        # Wait, I need to check where I imported it from.
-                        # In the original main.py it was defined there.
-                        # I should probably move it to document_service or keep it.
-                        # I imported it from app.services.document_service in the new main.py imports.
-                        # But wait, I didn't put it in document_service.py!
-                        # I only put process_document_background in document_service.py.
-                        # I need to add check_conversation_has_documents to document_service.py or keep it in main.py (but I prefer moving it).
-
                         has_documents = await check_conversation_has_documents(
                             session, conversation_id
                         )
-                        print(f"   ready_documents_present={has_documents}")
 
                         if has_documents:
-                            print(
-                                f"✅ RAG eligible: attempting retrieval for conversation {conversation_id}"
+                            logger.debug(
+                                "📚 RAG eligible: retrieving context for conversation %s",
+                                conversation_id,
                             )
-                            print(f"\n{'=' * 60}")
-                            print("📚 RAG: Documents found, retrieving context...")
-                            print(f"{'=' * 60}")
 
                             # Initialize RAG retriever with current session
                             vector_store = VectorStore(session)
@@ -287,58 +382,65 @@ async def websocket_chat(websocket: WebSocket):
                             )
 
                             if rag_context:
-                                print(
-                                    f"✅ Retrieved {len(rag_context.chunks)} relevant chunks"
+                                logger.info(
+                                    "✅ Retrieved %d relevant chunks",
+                                    len(rag_context.chunks),
                                 )
-                                print(f"{'=' * 60}\n")
                             else:
-                                print(
+                                logger.info(
                                     "⚠️  No relevant chunks found above similarity threshold"
                                 )
-                                print(f"{'=' * 60}\n")
                         else:
-                            print(
+                            logger.debug(
                                 "🚫 RAG skipped: no ready documents for this conversation"
                             )
                     except Exception as e:
-                        print(f"⚠️  RAG retrieval error: {str(e)}")
-                        print("   Falling back to normal chat without RAG")
+                        logger.warning(
+                            "⚠️  RAG retrieval error, falling back to normal chat: %s",
+                            e,
+                        )
                         rag_context = None
                 else:
-                    print(
+                    logger.debug(
                         "🚫 RAG skipped before document check: missing config or embedding generator"
                     )
 
                 # Construct prompt based on RAG availability
                 if rag_context:
                     # RAG-enhanced prompt with sources
-                    # Remove current user message from history (it's in rag_context)
-                    history_without_current = conversation_history[:-1]
-                    prompt = format_prompt_with_rag(
-                        history_without_current,
-                        thinking_mode,
-                        system_prompt,
-                        rag_context.formatted_sources,
-                        user_message,
-                    )
+                    # Replace current user message with one carrying the sources
+                    prompt_messages = [
+                        *conversation_history[:-1],
+                        rag_user_message(user_message, rag_context.formatted_sources),
+                    ]
                 else:
                     # Normal prompt without RAG
+                    prompt_messages = conversation_history
+
+                # Assemble input ids from the cached per-message ids; tokenizers
+                # that can't be assembled that way get the prompt string instead
+                prompt_ids = await asyncio.to_thread(
+                    format_prompt_ids,
+                    tokenizer,
+                    prompt_messages,
+                    thinking_mode,
+                    system_prompt,
+                    cache_last=rag_context is None,
+                )
+                if prompt_ids is None:
                     prompt = format_prompt(
-                        conversation_history, thinking_mode, system_prompt
+                        prompt_messages, thinking_mode, system_prompt
                     )
 
-                print("📝 Prompt construction parameters:")
-                print(f"  - thinking_mode: {thinking_mode}")
-                print("\n🎯 Expected assistant prefix:")
-                expected_prefix = (
-                    "<|im_start|>assistant\n<think>\n"
-                    if thinking_mode
-                    else "<|im_start|>assistant\n</think>\n"
-                )
-                print(f"{'=' * 80}\n")
-                print("🧾 Full prompt delivered to model:")
-                # print(prompt)
-                print(f"{'=' * 60}\n")
+                generation_slot = get_generation_slot(model_name)
+                if generation_slot is not None and generation_slot.locked():
+                    # Every slot is busy; tell the client before 'start', since
+                    # generation waits for one to free up
+                    await websocket.send_json({
+                        "type": "queued",
+                        "model": model_name,
+                        "conversation_id": conversation_id,
+                    })
 
                 await websocket.send_json({
                     "type": "start",
@@ -361,43 +463,50 @@ async def websocket_chat(websocket: WebSocket):
                     await asyncio.sleep(0)
 
                 loop = asyncio.get_running_loop()
-                stream_queue: asyncio.Queue = asyncio.Queue()
                 streamer = AsyncQueueTextStreamer(
                     tokenizer,
                     loop,
-                    stream_queue,
                     skip_prompt=True,
                     skip_special_tokens=False,
                 )
 
-                model_device = model_data.get(
-                    "device", getattr(model, "device", torch.device("cpu"))
-                )
-                inputs = tokenizer(
-                    prompt, return_tensors="pt", return_token_type_ids=False
-                )
-                inputs = {k: v.to(model_device) for k, v in inputs.items()}
+                model_device = loaded.device
+                if prompt_ids is not None:
+                    input_ids = torch.tensor([prompt_ids], device=model_device)
+                    inputs = {
+                        "input_ids": input_ids,
+                        "attention_mask": torch.ones_like(input_ids),
+                    }
+                else:
+                    inputs = tokenizer(
+                        prompt, return_tensors="pt", return_token_type_ids=False
+                    )
+                    inputs = {k: v.to(model_device) for k, v in inputs.items()}
 
                 # Get generation parameters from client settings with fallback to model config
                 gen_params = get_generation_params(client, model_config)
 
-                print(f"\n{'=' * 60}")
-                print("🎛️  Generation Parameters:")
-                print(f"{'=' * 60}")
-                for key, value in gen_params.items():
-                    print(f"  {key}: {value}")
-                print(f"{'=' * 60}\n")
+                logger.debug("🎛️  Generation parameters: %s", gen_params)
 
                 generation_kwargs = {
                     **inputs,
                     "pad_token_id": tokenizer.eos_token_id,
                     "streamer": streamer,
+                    # Stop in-engine at end of turn (needs the tokenizer)
+                    "stop_strings": GENERATION_STOP_STRINGS,
+                    "tokenizer": tokenizer,
+                    # End the worker thread's decode loop once we stop reading
+                    "stopping_criteria": StoppingCriteriaList([
+                        StopWhenStreamerClosed(streamer)
+                    ]),
                     **gen_params,  # Apply client parameters (includes max_new_tokens)
                 }
 
                 async def run_generation():
                     try:
-                        await asyncio.to_thread(model.generate, **generation_kwargs)
+                        # Queue behind other in-flight generations for this model
+                        async with generation_slot or contextlib.nullcontext():
+                            await asyncio.to_thread(model.generate, **generation_kwargs)
                     finally:
                         streamer.close()
 
@@ -409,61 +518,51 @@ async def websocket_chat(websocket: WebSocket):
                 # - For "none" models: skip thinking detection entirely
                 if thinking_behavior == "fixed":
                     in_thinking_block = True  # Assume thinking first for fixed models
-                    print(
-                        "🔍 Model behavior: 'fixed' - assuming thinking content first, will scan for </think>"
-                    )
                 elif thinking_behavior == "controllable":
                     in_thinking_block = thinking_mode  # Respect prompt format
-                    print(
-                        f"🔍 Model behavior: 'controllable' - respecting prompt format (thinking_mode={thinking_mode})"
-                    )
                 else:  # "none"
                     in_thinking_block = False  # No thinking detection
-                    print(
-                        "🔍 Model behavior: 'none' - skipping thinking detection entirely"
-                    )
+                logger.debug(
+                    "🔍 Model behavior: %r (initial in_thinking_block=%s)",
+                    thinking_behavior,
+                    in_thinking_block,
+                )
 
                 should_send_thinking = thinking_mode  # User preference for display
                 thinking_content = ""
                 saved_thinking_content = ""  # Store finalized thinking for DB
                 response_content = ""
-                thinking_started = False
                 response_started = False  # Track if we've seen actual content
                 found_closing_tag = False  # Track if we found </think> tag
 
                 async def emit_thinking_text(text: str):
-                    nonlocal thinking_content, thinking_started
+                    nonlocal thinking_content
                     if not text:
                         return
                     # Always accumulate thinking content (for DB storage)
                     thinking_content += text
 
                     # Always send to frontend (frontend decides whether to display)
-                    # Print emoji only at the start of thinking
-                    if not thinking_started:
-                        print("💭 ", end="", flush=True)
-                        thinking_started = True
-                    # print(text, end="", flush=True)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("💭 %s", text)
                     await send_thinking_update(thinking_content, complete=False)
 
                 async def finalize_thinking():
                     nonlocal thinking_content, saved_thinking_content, found_closing_tag
-                    nonlocal thinking_started, response_started
+                    nonlocal response_started
 
                     # Mark that we found the closing tag
                     found_closing_tag = True
 
                     # Always send to frontend (frontend decides whether to display)
-                    # Print closing emoji and summary
-                    print(" 💭")
-                    print(f"\n💭 Thinking complete ({len(thinking_content)} chars)")
-                    print(f"{'=' * 60}\n")
+                    logger.debug(
+                        "💭 Thinking complete (%d chars)", len(thinking_content)
+                    )
                     await send_thinking_update(thinking_content, complete=True)
 
                     # Save thinking content before clearing for next iteration
                     saved_thinking_content = thinking_content
                     thinking_content = ""
-                    thinking_started = False
                     # Reset response flag so we trim whitespace after thinking ends
                     response_started = False
 
@@ -487,7 +586,8 @@ async def websocket_chat(websocket: WebSocket):
                             # All whitespace, skip displaying it but keep in response_content
                             return
 
-                    # print(f"{display_text}", end="", flush=True)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("tok: %s", display_text)
                     await websocket.send_json({
                         "type": "token",
                         "conversation_id": conversation_id,
@@ -495,138 +595,83 @@ async def websocket_chat(websocket: WebSocket):
                     })
                     await asyncio.sleep(0)  # Yield to event loop to send immediately
 
-                print("🔄 Starting token stream...\n")
-
                 try:
                     message_ended = False
-                    while not message_ended:
-                        text = await stream_queue.get()
-                        if text is streamer.stop_signal:
-                            break
-
+                    async for text in streamer:
                         # Filter out <|end_of_text|> special token
                         text = text.replace("<|end_of_text|>", "")
 
-                        remaining = text
-                        while remaining and not message_ended:
+                        # Walk the chunk with a cursor instead of re-slicing it per tag
+                        pos = 0
+                        while pos < len(text) and not message_ended:
                             # Defensive: stop if the model starts a new role turn mid-stream
-                            new_turn_indices = [
-                                idx
-                                for idx in [
-                                    remaining.find("<|im_start|>user"),
-                                    remaining.find("<|im_start|>assistant"),
-                                    remaining.find("<|im_start|>system"),
-                                ]
-                                if idx != -1
-                            ]
-                            next_new_turn = (
-                                min(new_turn_indices) if new_turn_indices else -1
-                            )
-                            if next_new_turn != -1:
-                                if next_new_turn > 0:
-                                    await emit_response_text(remaining[:next_new_turn])
-                                print(
+                            new_turn = NEW_TURN_PATTERN.search(text, pos)
+                            if new_turn:
+                                if new_turn.start() > pos:
+                                    await emit_response_text(
+                                        text[pos : new_turn.start()]
+                                    )
+                                logger.warning(
                                     "⚠️  Detected unexpected <|im_start|> role tag mid-stream; terminating response early."
                                 )
                                 message_ended = True
-                                remaining = ""
                                 break
 
                             # Skip thinking detection for "none" models
                             if thinking_behavior == "none":
                                 # Just emit everything as response
-                                next_end = remaining.find("<|im_end|>")
+                                next_end = text.find(IM_END_TAG, pos)
                                 if next_end != -1:
-                                    if next_end > 0:
-                                        await emit_response_text(remaining[:next_end])
-                                    remaining = remaining[
-                                        next_end + len("<|im_end|>") :
-                                    ]
+                                    if next_end > pos:
+                                        await emit_response_text(text[pos:next_end])
+                                    pos = next_end + len(IM_END_TAG)
                                     message_ended = True
                                 else:
-                                    await emit_response_text(remaining)
-                                    remaining = ""
+                                    await emit_response_text(text[pos:])
+                                    pos = len(text)
                             elif in_thinking_block:
                                 # Look for closing tag - support both </think> and </thinking>
-                                close_idx = remaining.find("</think>")
-                                close_tag_len = len("</think>")
-
-                                # Also check for alternative format
-                                alt_close_idx = remaining.find("</thinking>")
-                                if alt_close_idx != -1 and (
-                                    close_idx == -1 or alt_close_idx < close_idx
-                                ):
-                                    close_idx = alt_close_idx
-                                    close_tag_len = len("</thinking>")
-                                    print(
-                                        "🔍 Detected alternative closing tag: </thinking>"
-                                    )
-
-                                if close_idx != -1:
-                                    await emit_thinking_text(remaining[:close_idx])
-                                    remaining = remaining[close_idx + close_tag_len :]
+                                close_tag = find_next_tag(
+                                    text, pos, THINK_CLOSE_TAGS, THINK_CLOSE_PATTERN
+                                )
+                                if close_tag:
+                                    tag_start, tag_end, _ = close_tag
+                                    await emit_thinking_text(text[pos:tag_start])
+                                    pos = tag_end
                                     await finalize_thinking()
                                     in_thinking_block = False
                                 else:
-                                    await emit_thinking_text(remaining)
-                                    remaining = ""
+                                    await emit_thinking_text(text[pos:])
+                                    pos = len(text)
                             else:
-                                # Look for opening tags - support both <think> and <thinking>
-                                next_think = remaining.find("<think>")
-                                next_thinking = remaining.find("<thinking>")
-                                next_end = remaining.find("<|im_end|>")
-
-                                next_token = None
-                                next_idx = len(remaining)
-                                think_tag_len = 0
-
-                                # Check for <think> tag
-                                if next_think != -1 and next_think < next_idx:
-                                    next_token = "think"
-                                    next_idx = next_think
-                                    think_tag_len = len("<think>")
-
-                                # Check for alternative <thinking> tag
-                                if next_thinking != -1 and next_thinking < next_idx:
-                                    next_token = "think"
-                                    next_idx = next_thinking
-                                    think_tag_len = len("<thinking>")
-                                    print(
-                                        "🔍 Detected alternative opening tag: <thinking>"
-                                    )
-
-                                # Check for end tag
-                                if next_end != -1 and next_end < next_idx:
-                                    next_token = "end"
-                                    next_idx = next_end
-
-                                if next_token:
-                                    if next_idx > 0:
-                                        await emit_response_text(remaining[:next_idx])
-                                    if next_token == "think":
-                                        remaining = remaining[
-                                            next_idx + think_tag_len :
-                                        ]
+                                # Look for opening tags (<think> or <thinking>) or end of turn
+                                tag = find_next_tag(
+                                    text, pos, RESPONSE_TAGS, RESPONSE_TAG_PATTERN
+                                )
+                                if tag:
+                                    tag_start, tag_end, tag_text = tag
+                                    if tag_start > pos:
+                                        await emit_response_text(text[pos:tag_start])
+                                    pos = tag_end
+                                    if tag_text == IM_END_TAG:
+                                        message_ended = True
+                                    else:
                                         in_thinking_block = True
                                         thinking_content = ""
-                                        thinking_started = False
-                                    else:
-                                        remaining = remaining[
-                                            next_idx + len("<|im_end|>") :
-                                        ]
-                                        message_ended = True
                                 else:
-                                    await emit_response_text(remaining)
-                                    remaining = ""
-                    print("\n\n✅ Stream complete!")
-                    print(f"📊 Response length: {len(response_content)} chars")
-                    print(f"{'=' * 60}\n")
+                                    await emit_response_text(text[pos:])
+                                    pos = len(text)
+                        if message_ended:
+                            break
+                    logger.info(
+                        "✅ Stream complete: response=%d chars", len(response_content)
+                    )
 
                     # Reclassification: If we never found </think> but accumulated thinking content,
                     # it means the model didn't actually generate thinking - reclassify as response
                     if not found_closing_tag and thinking_content:
-                        print(
-                            "\n⚠️  Reclassifying thinking as response (no closing tag found)\n"
+                        logger.info(
+                            "⚠️  Reclassifying thinking as response (no closing tag found)"
                         )
 
                         # Send reclassification signal to frontend
@@ -645,6 +690,8 @@ async def websocket_chat(websocket: WebSocket):
                     thinking_to_save = (
                         saved_thinking_content if found_closing_tag else None
                     )
+                    # The user turn must be stored before truncating around the reply
+                    await user_turn_write
                     await persist_assistant_turn(
                         session,
                         conversation_id,
@@ -667,9 +714,9 @@ async def websocket_chat(websocket: WebSocket):
                         await generation_task
 
     except WebSocketDisconnect:
-        print("Client disconnected")
+        logger.info("Client disconnected")
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.error("WebSocket chat error: %s", e, exc_info=True)
         try:
             # Try to include conversation_id if available in the error response
             error_response = {"type": "error", "message": str(e)}
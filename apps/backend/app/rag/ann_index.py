@@ -0,0 +1,96 @@
+"""Optional in-memory HNSW index (usearch) for large conversations."""
+
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    from usearch.index import Index
+except ImportError:
+    Index = None
+
+logger = logging.getLogger(__name__)
+
+# Conversations smaller than this are searched exactly; building a graph
+# only pays off once a full scan gets expensive
+ANN_MIN_CHUNKS = 1000
+# Candidates fetched per requested result, so thresholding still has
+# enough neighbours to choose from despite approximate recall
+ANN_OVERSAMPLE = 4
+# Number of conversation indexes kept in memory
+ANN_CACHE_SIZE = 8
+
+_indexes: "OrderedDict[str, ConversationIndex]" = OrderedDict()
+
+
+@dataclass(slots=True)
+class ConversationIndex:
+    """HNSW graph over one conversation's chunk embeddings.
+
+    Attributes:
+        stamp: Chunk count and latest upload time the index was built from
+        chunk_ids: Chunk IDs, where each ID's position is its key in the graph
+        index: usearch Index holding the unit-norm embeddings
+    """
+
+    stamp: tuple[Any, ...]
+    chunk_ids: list[str]
+    index: Any
+
+    def search(self, query: np.ndarray, count: int) -> list[tuple[str, float]]:
+        """Return up to count (chunk_id, cosine similarity) pairs, nearest first."""
+        count = min(count, len(self.chunk_ids))
+        matches = self.index.search(query.astype(np.float32), count)
+        return [
+            (self.chunk_ids[int(key)], 1.0 - float(distance))
+            for key, distance in zip(matches.keys, matches.distances)
+        ]
+
+
+def ann_available() -> bool:
+    """Whether usearch is installed."""
+    return Index is not None
+
+
+def build_index(
+    stamp: tuple[Any, ...], chunk_ids: list[str], embeddings: np.ndarray
+) -> ConversationIndex:
+    """Build an HNSW index over chunk embeddings (CPU-bound; run off the loop).
+
+    Args:
+        stamp: Value identifying the chunk set the index is built from
+        chunk_ids: IDs of the chunks, aligned with embeddings
+        embeddings: Float32 array of shape (len(chunk_ids), dimension)
+    """
+    index = Index(
+        ndim=embeddings.shape[1],
+        metric="cos",
+        dtype="f32",
+        connectivity=16,
+        expansion_add=64,
+        expansion_search=100,
+    )
+    index.add(np.arange(len(chunk_ids), dtype=np.uint64), embeddings)
+    return ConversationIndex(stamp=stamp, chunk_ids=chunk_ids, index=index)
+
+
+def get_cached_index(
+    conversation_id: str, stamp: tuple[Any, ...]
+) -> Optional[ConversationIndex]:
+    """Return the cached index for a conversation if it is still current."""
+    cached = _indexes.get(conversation_id)
+    if cached is None or cached.stamp != stamp:
+        return None
+    _indexes.move_to_end(conversation_id)
+    return cached
+
+
+def cache_index(conversation_id: str, conversation_index: ConversationIndex) -> None:
+    """Cache a conversation's index, evicting the least recently used."""
+    _indexes[conversation_id] = conversation_index
+    _indexes.move_to_end(conversation_id)
+    while len(_indexes) > ANN_CACHE_SIZE:
+        _indexes.popitem(last=False)
@@ -1,18 +1,19 @@
-"""Text chunking using LangChain RecursiveCharacterTextSplitter."""
+"""Text chunking with recursive literal-separator splitting."""
 
+import functools
 import logging
+from collections import deque
 from dataclasses import dataclass
 from typing import Any
 
 from docling.chunking import HybridChunker
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from .document_processor import ProcessedDocument
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class TextChunk:
     """Text chunk with metadata."""
 
@@ -21,8 +22,122 @@ class TextChunk:
     metadata: dict[str, Any]
 
 
+class LiteralSeparatorSplitter:
+    """Recursive character splitter for literal (non-regex) separators.
+
+    Produces the same chunks as LangChain's RecursiveCharacterTextSplitter
+    with ``is_separator_regex=False`` and its defaults (separators kept at the
+    start of the following piece, chunks whitespace-stripped, ``len`` as the
+    length function), but probes and splits with ``str`` methods and merges
+    pieces with a deque and a running length instead of re-slicing the
+    window list for every dropped piece.
+    """
+
+    def __init__(
+        self, chunk_size: int, chunk_overlap: int, separators: tuple[str, ...]
+    ):
+        """Initialize the splitter.
+
+        Args:
+            chunk_size: Maximum chunk length in characters
+            chunk_overlap: Characters carried over between adjacent chunks
+            separators: Separators in order of preference; "" splits into
+                characters
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+
+    def split_text(self, text: str) -> list[str]:
+        """Split text into chunks of at most chunk_size characters."""
+        return self._split(text, self.separators)
+
+    def _split(self, text: str, separators: tuple[str, ...]) -> list[str]:
+        # Use the first separator that occurs in the text
+        separator = separators[-1]
+        finer_separators: tuple[str, ...] = ()
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if candidate in text:
+                separator = candidate
+                finer_separators = separators[i + 1 :]
+                break
+
+        if separator:
+            first, *rest = text.split(separator)
+            pieces = [first, *(separator + piece for piece in rest)]
+        else:
+            pieces = list(text)
+
+        # Merge small pieces; split oversized ones with the finer separators
+        chunks: list[str] = []
+        small_pieces: list[str] = []
+        for piece in pieces:
+            if not piece:
+                continue
+            if len(piece) < self.chunk_size:
+                small_pieces.append(piece)
+                continue
+            if small_pieces:
+                chunks.extend(self._merge(small_pieces))
+                small_pieces = []
+            if finer_separators:
+                chunks.extend(self._split(piece, finer_separators))
+            else:
+                chunks.append(piece)
+        if small_pieces:
+            chunks.extend(self._merge(small_pieces))
+        return chunks
+
+    def _merge(self, pieces: list[str]) -> list[str]:
+        chunks: list[str] = []
+        window: deque[str] = deque()
+        total = 0
+        for piece in pieces:
+            length = len(piece)
+            if total + length > self.chunk_size and window:
+                chunk = "".join(window).strip()
+                if chunk:
+                    chunks.append(chunk)
+                # Keep at most chunk_overlap characters, and room for piece
+                while total > self.chunk_overlap or (
+                    total + length > self.chunk_size and total > 0
+                ):
+                    total -= len(window.popleft())
+            window.append(piece)
+            total += length
+        chunk = "".join(window).strip()
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+
+@functools.lru_cache(maxsize=8)
+def _get_splitter(
+    chunk_size: int, chunk_overlap: int, separators: tuple[str, ...]
+) -> LiteralSeparatorSplitter:
+    """Return a shared splitter for this configuration."""
+    return LiteralSeparatorSplitter(chunk_size, chunk_overlap, separators)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_hybrid_chunker(chunk_size: int, chunk_overlap: int) -> HybridChunker:
+    """Return a shared HybridChunker for this configuration.
+
+    Building a HybridChunker loads its tokenizer, so instances are reused
+    across TextChunker objects instead of being rebuilt per document.
+    """
+    # We use default configuration which respects document structure
+    return HybridChunker(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
 class TextChunker:
-    """Chunks text using LangChain RecursiveCharacterTextSplitter."""
+    """Chunks text with Docling HybridChunker or a recursive separator splitter."""
 
     def __init__(
         self,
@@ -59,21 +174,9 @@ class TextChunker:
         self.chunk_overlap = chunk_overlap
         self.separators = separators
 
-        # Initialize LangChain RecursiveCharacterTextSplitter
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=separators,
-            length_function=len,  # Use character count
-            is_separator_regex=False,
-        )
-
-        # Initialize Docling HybridChunker
-        # We use default configuration which respects document structure
-        self.hybrid_chunker = HybridChunker(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-        )
+        # Splitter and Docling HybridChunker are shared per configuration
+        self.splitter = _get_splitter(chunk_size, chunk_overlap, tuple(separators))
+        self.hybrid_chunker = _get_hybrid_chunker(chunk_size, chunk_overlap)
 
         logger.info(
             "TextChunker initialized with chunk_size=%d, "
@@ -106,6 +209,9 @@ class TextChunker:
             len(processed_doc.text),
         )
 
+        # Prepended to each chunk for better retrieval context
+        prefix = f"Document: {processed_doc.filename}\n"
+
         # Use HybridChunker if Docling document is available
         if processed_doc.docling_document:
             logger.info("Using Docling HybridChunker for structured chunking")
@@ -123,13 +229,10 @@ class TextChunker:
                     # "page_numbers": doc_chunk.meta.page_numbers,
                 }
 
-                # Prepend filename to text for better retrieval context
-                contextual_text = (
-                    f"Document: {processed_doc.filename}\n{doc_chunk.text}"
-                )
-
                 chunk = TextChunk(
-                    text=contextual_text, chunk_index=idx, metadata=chunk_metadata
+                    text=prefix + doc_chunk.text,
+                    chunk_index=idx,
+                    metadata=chunk_metadata,
                 )
                 chunks.append(chunk)
 
@@ -140,11 +243,12 @@ class TextChunker:
             )
             return chunks
 
-        # Fallback: Split text into chunks using LangChain splitter
+        # Fallback: Split text into chunks on separators
         text_chunks = self.splitter.split_text(processed_doc.text)
 
-        # Create TextChunk objects with metadata
+        # Create TextChunk objects with metadata, summing sizes as we go
         chunks = []
+        total_size = 0
         for idx, chunk_text in enumerate(text_chunks):
             # Inherit metadata from document and add chunk-specific info
             chunk_metadata = {
@@ -154,14 +258,14 @@ class TextChunker:
                 "total_chunks": len(text_chunks),
             }
 
-            # Prepend filename to text for better retrieval context
-            contextual_text = f"Document: {processed_doc.filename}\n{chunk_text}"
+            contextual_text = prefix + chunk_text
+            total_size += len(contextual_text)
             chunk = TextChunk(
                 text=contextual_text, chunk_index=idx, metadata=chunk_metadata
             )
             chunks.append(chunk)
 
-        avg_size = sum(len(c.text) for c in chunks) // len(chunks) if chunks else 0
+        avg_size = total_size // len(chunks) if chunks else 0
         logger.info(
             "Created %d chunks from document %s (avg size: %d chars)",
             len(chunks),
@@ -11,6 +11,7 @@ class RAGConfig:
 
     enabled: bool = True
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_precision: str = "fp32"
     chunk_size: int = 512
     chunk_overlap: int = 50
     top_k: int = 3
@@ -25,6 +26,7 @@ class RAGConfig:
         Environment variables:
             RAG_ENABLED: Enable/disable RAG (default: true)
             RAG_EMBEDDING_MODEL: Embedding model name (default: sentence-transformers/all-MiniLM-L6-v2)
+            RAG_EMBEDDING_PRECISION: Embedding weights: fp32, fp16, bf16 or int8 (default: fp32)
             RAG_CHUNK_SIZE: Chunk size in tokens (default: 512)
             RAG_CHUNK_OVERLAP: Chunk overlap in tokens (default: 50)
             RAG_TOP_K: Number of chunks to retrieve (default: 5)
@@ -40,6 +42,7 @@ class RAGConfig:
             embedding_model=os.getenv(
                 "RAG_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
             ),
+            embedding_precision=os.getenv("RAG_EMBEDDING_PRECISION", "fp32").lower(),
             chunk_size=int(os.getenv("RAG_CHUNK_SIZE", "512")),
             chunk_overlap=int(os.getenv("RAG_CHUNK_OVERLAP", "50")),
             top_k=int(os.getenv("RAG_TOP_K", "3")),
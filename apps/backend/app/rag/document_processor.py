@@ -1,16 +1,22 @@
 """Document processing using Docling."""
 
-import logging
+import asyncio
 import hashlib
+import logging
+import mmap
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, ClassVar, Optional
+from typing import Any, ClassVar, Iterable, Optional
 
+from docling.datamodel.base_models import InputFormat
 from docling.document_converter import DocumentConverter
 from docling.datamodel.document import DoclingDocument
 
 logger = logging.getLogger(__name__)
 
+# Plain-text uploads larger than this are memory-mapped instead of read
+MMAP_THRESHOLD_BYTES = 1024 * 1024
+
 
 @dataclass
 class ProcessedDocument:
@@ -21,9 +27,53 @@ class ProcessedDocument:
     tables: list[dict[str, Any]]
     filename: str
     content_hash: str
+    # Parsed tree for structure-aware chunking; can be large for big PDFs,
+    # so the pipeline drops it once chunking is done
     docling_document: Optional[DoclingDocument] = None
 
 
+def compute_content_hash(data: bytes) -> str:
+    """Return the hex SHA-256 digest used to detect duplicate documents.
+
+    hashlib hands SHA-256 to OpenSSL, which uses the CPU's SHA extensions
+    when present. The hash is for deduplication, not security, which is
+    declared with usedforsecurity=False (this also keeps it available on
+    FIPS-restricted builds).
+
+    Args:
+        data: Bytes to hash (bytes, bytearray, memoryview, or mmap)
+
+    Returns:
+        Hex-encoded SHA-256 digest
+    """
+    digest = hashlib.new("sha256", usedforsecurity=False)
+    digest.update(memoryview(data))
+    return digest.hexdigest()
+
+
+def compute_content_hashes(buffers: Iterable[bytes]) -> list[str]:
+    """Return the hex SHA-256 digest of each buffer, in order.
+
+    Used to give every chunk a content identity. Chunks are small, so the
+    per-call cost is dominated by constructing the OpenSSL digest context
+    rather than by compression; cloning one initialised context with
+    ``copy()`` skips the algorithm lookup for every buffer.
+
+    Args:
+        buffers: Bytes-like objects to hash
+
+    Returns:
+        Hex-encoded SHA-256 digests, one per buffer
+    """
+    base = hashlib.new("sha256", usedforsecurity=False)
+    digests = []
+    for data in buffers:
+        digest = base.copy()
+        digest.update(data)
+        digests.append(digest.hexdigest())
+    return digests
+
+
 class DocumentProcessor:
     """Extracts text and structure from documents using Docling."""
 
@@ -46,6 +96,13 @@ class DocumentProcessor:
             cls._instance = cls()
         return cls._instance
 
+    def warmup(self) -> None:
+        """Build the PDF pipeline (layout/table models) ahead of the first upload.
+
+        Docling otherwise constructs it lazily inside the first conversion.
+        """
+        self.converter.initialize_pipeline(InputFormat.PDF)
+
     async def process_document(
         self, file_path: Path, filename: str
     ) -> ProcessedDocument:
@@ -69,12 +126,18 @@ class DocumentProcessor:
             if not file_path.exists():
                 raise FileNotFoundError(f"File not found: {file_path}")
 
-            # Handle plain text files directly
+            # Both paths block on file reads (and Docling on parsing); run
+            # them in a worker thread so the event loop keeps serving
             if self._is_plain_text(file_path):
-                return self._process_plain_text(file_path, filename)
+                # Handle plain text files directly
+                return await asyncio.to_thread(
+                    self._process_plain_text, file_path, filename
+                )
 
             # Use Docling for other formats (PDF, DOCX, etc.)
-            return self._process_with_docling(file_path, filename)
+            return await asyncio.to_thread(
+                self._process_with_docling, file_path, filename
+            )
 
         except Exception as e:
             logger.error("Error processing document %s: %s", filename, e)
@@ -104,56 +167,63 @@ class DocumentProcessor:
         Returns:
             ProcessedDocument with text content
         """
-        try:
-            # Read text file with UTF-8 encoding
-            text = file_path.read_text(encoding="utf-8")
-
-            metadata = {
-                "filename": filename,
-                "file_type": file_path.suffix.lower(),
-                "char_count": len(text),
-                "line_count": text.count("\n") + 1,
-            }
+        # Read the file once; large files are mapped rather than copied
+        with open(file_path, "rb") as f:
+            if file_path.stat().st_size > MMAP_THRESHOLD_BYTES:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    text, content_hash, encoding = self._decode_and_hash(data)
+            else:
+                text, content_hash, encoding = self._decode_and_hash(f.read())
+
+        metadata = {
+            "filename": filename,
+            "file_type": file_path.suffix.lower(),
+            "char_count": len(text),
+            "line_count": text.count("\n") + 1,
+        }
+        if encoding is not None:
+            metadata["encoding"] = encoding
 
-            logger.info(
-                "Processed plain text file: %s (%d chars)",
-                filename,
-                metadata["char_count"],
-            )
+        logger.info(
+            "Processed plain text file: %s (%d chars)",
+            filename,
+            metadata["char_count"],
+        )
 
-            # Calculate hash
-            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return ProcessedDocument(
+            text=text,
+            metadata=metadata,
+            tables=[],
+            filename=filename,
+            content_hash=content_hash,
+            docling_document=None,
+        )
 
-            return ProcessedDocument(
-                text=text,
-                metadata=metadata,
-                tables=[],
-                filename=filename,
-                content_hash=content_hash,
-                docling_document=None,
-            )
+    def _decode_and_hash(self, data: Any) -> tuple[str, str, Optional[str]]:
+        """Decode raw file bytes and compute their content hash.
 
+        Args:
+            data: Raw file contents (bytes or mmap)
+
+        Returns:
+            Tuple of (text, content hash, fallback encoding or None)
+        """
+        encoding = None
+        try:
+            text = str(data, "utf-8")
         except UnicodeDecodeError:
             # Try with different encoding if UTF-8 fails
-            text = file_path.read_text(encoding="latin-1")
-            metadata = {
-                "filename": filename,
-                "file_type": file_path.suffix.lower(),
-                "char_count": len(text),
-                "line_count": text.count("\n") + 1,
-                "encoding": "latin-1",
-            }
-            # Calculate hash
-            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
-
-            return ProcessedDocument(
-                text=text,
-                metadata=metadata,
-                tables=[],
-                filename=filename,
-                content_hash=content_hash,
-                docling_document=None,
-            )
+            text = str(data, "latin-1")
+            encoding = "latin-1"
+
+        if encoding is None and "\r" not in text:
+            # The raw bytes already are text.encode("utf-8"); hash them as-is
+            return text, compute_content_hash(data), None
+
+        # Normalize newlines like text-mode reads do, and hash the UTF-8
+        # encoding of the result so digests match other uploads
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text, compute_content_hash(text.encode("utf-8")), encoding
 
     def _process_with_docling(
         self, file_path: Path, filename: str
@@ -175,7 +245,7 @@ class DocumentProcessor:
         text = result.document.export_to_markdown()
 
         # Extract metadata
-        metadata = self._extract_metadata(result, filename, file_path)
+        metadata = self._extract_metadata(result, filename, file_path, text)
 
         # Extract tables
         tables = self._extract_tables(result)
@@ -188,7 +258,7 @@ class DocumentProcessor:
         )
 
         # Calculate hash
-        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        content_hash = compute_content_hash(text.encode("utf-8"))
 
         return ProcessedDocument(
             text=text,
@@ -200,7 +270,7 @@ class DocumentProcessor:
         )
 
     def _extract_metadata(
-        self, result: Any, filename: str, file_path: Path
+        self, result: Any, filename: str, file_path: Path, text: str
     ) -> dict[str, Any]:
         """Extract metadata from Docling result.
 
@@ -208,6 +278,7 @@ class DocumentProcessor:
             result: Docling conversion result
             filename: Original filename
             file_path: Path to the file
+            text: Markdown already exported from the document
 
         Returns:
             Dictionary with metadata
@@ -223,7 +294,6 @@ class DocumentProcessor:
             metadata["page_count"] = len(doc.pages)
 
         # Extract text statistics
-        text = doc.export_to_markdown()
         metadata["char_count"] = len(text)
 
         # Try to extract additional metadata from document properties
@@ -247,22 +317,18 @@ class DocumentProcessor:
         Returns:
             List of table dictionaries
         """
-        tables = []
-
-        # Docling extracts tables as part of the document structure
+        # Docling extracts tables as part of the document structure. Each
+        # TableItem keeps its grid in table.data; export that as markdown
+        # rather than str(table), which reprs every cell object.
         doc = result.document
-        if hasattr(doc, "tables") and doc.tables:
-            for idx, table in enumerate(doc.tables):
-                table_data = {
-                    "index": idx,
-                    "content": str(table),
-                }
-                # Try to extract table metadata if available
-                if hasattr(table, "num_rows"):
-                    table_data["num_rows"] = table.num_rows
-                if hasattr(table, "num_cols"):
-                    table_data["num_cols"] = table.num_cols
-
-                tables.append(table_data)
+        tables = [
+            {
+                "index": idx,
+                "content": table.export_to_markdown(doc=doc),
+                "num_rows": table.data.num_rows,
+                "num_cols": table.data.num_cols,
+            }
+            for idx, table in enumerate(doc.tables)
+        ]
 
         return tables
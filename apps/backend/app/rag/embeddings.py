@@ -1,10 +1,14 @@
 """Embedding generation module using sentence-transformers."""
 
+import asyncio
+import contextlib
 import logging
 from typing import List, Optional
 
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import batch_to_device
 
 from ..services.model_utils import get_preferred_device
 from .config import RAGConfig
@@ -12,12 +16,114 @@ from .config import RAGConfig
 logger = logging.getLogger(__name__)
 
 
+def _apply_precision(
+    model: SentenceTransformer, precision: str, device: torch.device
+) -> None:
+    """Convert the embedding model's weights to RAG_EMBEDDING_PRECISION.
+
+    fp16/bf16 halve the weight bandwidth on GPU/MPS (and bf16 on CPUs with
+    native bf16). int8 applies PyTorch dynamic quantization to the Linear
+    layers, which only has CPU kernels. Unsupported combinations keep fp32.
+    """
+    if precision in ("", "fp32"):
+        return
+    if precision == "fp16" and device.type in ("cuda", "mps"):
+        model.half()
+    elif precision == "bf16":
+        model.to(torch.bfloat16)
+    elif precision == "int8" and device.type == "cpu":
+        torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    else:
+        logger.warning(
+            "⚠️  RAG_EMBEDDING_PRECISION=%s is not supported on %s, keeping fp32",
+            precision,
+            device,
+        )
+        return
+    logger.info("Embedding model running in %s", precision)
+
+
+class EmbeddingCoalescer:
+    """Batches concurrent single-text embedding requests into one model call.
+
+    The first request opens a short window; everything submitted before it
+    closes (or until max_batch texts are waiting) is embedded together in a
+    worker thread, and each caller gets its own row back.
+
+    Attributes:
+        generator: EmbeddingGenerator that runs the batches
+        max_batch: Texts per model call
+        window: Seconds to wait for more texts before embedding a batch
+    """
+
+    def __init__(
+        self,
+        generator: "EmbeddingGenerator",
+        max_batch: int = 16,
+        window: float = 0.005,
+    ):
+        self.generator = generator
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._full = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, text: str) -> np.ndarray:
+        """Embed text as part of the next batch.
+
+        Args:
+            text: Input text to embed
+
+        Returns:
+            Numpy array of shape (dimension,) containing the embedding
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if self._worker is None or self._worker.done():
+            # Fresh event per worker so it is bound to the running loop
+            self._full = asyncio.Event()
+            self._worker = asyncio.create_task(self._drain())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _drain(self) -> None:
+        while self._pending:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._full.wait(), self.window)
+            batch = self._pending[: self.max_batch]
+            del self._pending[: self.max_batch]
+            if len(self._pending) < self.max_batch:
+                self._full.clear()
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(self._embed, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    def _embed(self, texts: list[str]) -> list[np.ndarray]:
+        if len(texts) == 1:
+            return [self.generator.generate_embedding(texts[0])]
+        return list(self.generator.generate_batch_embeddings(texts))
+
+
 class EmbeddingGenerator:
     """Generates embeddings using sentence-transformers.
 
     This class handles loading and caching of the embedding model,
     and provides methods for generating embeddings for single texts
-    or batches of texts.
+    or batches of texts. Embeddings are L2-normalized on the model's
+    device, so cosine similarity between them is a plain dot product.
 
     Attributes:
         model: The loaded SentenceTransformer model
@@ -38,7 +144,9 @@ class EmbeddingGenerator:
             config = RAGConfig.from_env()
 
         self.model_name = config.embedding_model
+        self.precision = config.embedding_precision
         self._load_model()
+        self.coalescer = EmbeddingCoalescer(self)
 
     def _load_model(self) -> None:
         """Load the sentence-transformers model.
@@ -55,6 +163,8 @@ class EmbeddingGenerator:
                 self.model_name,
                 device=device,
             )
+            EmbeddingGenerator._model.eval()
+            _apply_precision(EmbeddingGenerator._model, self.precision, device)
             logger.info(f"Model loaded successfully: {self.model_name}")
 
         self.model = EmbeddingGenerator._model
@@ -68,6 +178,14 @@ class EmbeddingGenerator:
             # Get dimension from model
             self.dimension = self.model.get_sentence_embedding_dimension()
 
+        # Single-text queries skip encode() unless the model applies a default
+        # prompt or output truncation, which only encode() knows how to do
+        self._preprocess = getattr(self.model, "preprocess", self.model.tokenize)
+        self._direct_forward = not (
+            getattr(self.model, "default_prompt_name", None)
+            or getattr(self.model, "truncate_dim", None)
+        )
+
     @classmethod
     def get_instance(cls, config: Optional[RAGConfig] = None) -> "EmbeddingGenerator":
         """Get singleton instance of EmbeddingGenerator.
@@ -85,22 +203,42 @@ class EmbeddingGenerator:
     def generate_embedding(self, text: str) -> np.ndarray:
         """Generate embedding vector for a single text.
 
+        This is the per-query path, so it calls the model directly: encode()
+        moves the model to its device, switches it to eval mode, length-sorts
+        and re-stacks its inputs on every call, none of which a single text
+        needs.
+
         Args:
             text: Input text to embed
 
         Returns:
             Numpy array of shape (dimension,) containing the embedding
         """
-        embedding = self.model.encode(
-            text, convert_to_numpy=True, show_progress_bar=False
-        )
-        return embedding
+        if not self._direct_forward:
+            return self.model.encode(
+                text,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+
+        with torch.inference_mode():
+            features = batch_to_device(self._preprocess([text]), self.model.device)
+            embedding = self.model(features)["sentence_embedding"][0]
+            embedding = torch.nn.functional.normalize(embedding, p=2, dim=0)
+        return embedding.float().cpu().numpy()
 
     def generate_batch_embeddings(
         self, texts: List[str], batch_size: int = 32
     ) -> np.ndarray:
         """Generate embeddings for multiple texts efficiently.
 
+        Texts are encoded longest first, batch_size at a time, the same
+        bucketing encode() does internally so each batch is padded only to
+        its own longest text. Each batch is written straight into its rows
+        of one preallocated output array, so memory peaks at the result plus
+        a single batch rather than a stacked copy of every batch.
+
         Args:
             texts: List of input texts to embed
             batch_size: Batch size for processing (default: 32)
@@ -108,7 +246,52 @@ class EmbeddingGenerator:
         Returns:
             Numpy array of shape (len(texts), dimension)
         """
-        embeddings = self.model.encode(
-            texts, convert_to_numpy=True, batch_size=batch_size, show_progress_bar=False
-        )
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), batch_size):
+            rows = order[start : start + batch_size]
+            batch = self.model.encode(
+                [texts[i] for i in rows],
+                convert_to_tensor=True,
+                normalize_embeddings=True,
+                batch_size=batch_size,
+                show_progress_bar=False,
+            )
+            embeddings[rows] = batch.float().cpu().numpy()
+        return embeddings
+
+    def generate_missing_embeddings(
+        self,
+        texts: List[str],
+        keys: List[str],
+        known: dict[str, np.ndarray],
+    ) -> np.ndarray:
+        """Generate embeddings, reusing vectors that are already known.
+
+        Texts whose key (content hash) is in ``known`` are not re-embedded,
+        and texts that share a key are embedded once.
+
+        Args:
+            texts: List of input texts to embed
+            keys: Content key of each text
+            known: Previously computed embeddings by key
+
+        Returns:
+            Numpy array of shape (len(texts), dimension)
+        """
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            vector = known.get(key)
+            if vector is not None and vector.shape == (self.dimension,):
+                embeddings[i] = vector
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            fresh = self.generate_batch_embeddings([
+                texts[rows[0]] for rows in missing.values()
+            ])
+            for rows, vector in zip(missing.values(), fresh):
+                embeddings[rows] = vector
         return embeddings
@@ -8,22 +8,85 @@ This module orchestrates the complete RAG document processing flow:
 5. Update document status to "ready" or "failed"
 """
 
+import asyncio
 import logging
 from pathlib import Path
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db.models import Document
-from .chunker import TextChunker
+from .chunker import TextChunk, TextChunker
 from .config import RAGConfig
-from .document_processor import DocumentProcessor
+from .document_processor import DocumentProcessor, compute_content_hashes
 from .embeddings import EmbeddingGenerator
 from .vector_store import VectorStore
 
 logger = logging.getLogger(__name__)
 
+# Chunks embedded per batch; storing one batch overlaps embedding the next
+PIPELINE_BATCH_SIZE = 64
+
+
+async def _embed_and_store(
+    document_id: str,
+    chunks: list[TextChunk],
+    chunk_texts: list[str],
+    chunk_hashes: list[str],
+    embedding_generator: EmbeddingGenerator,
+    vector_store: VectorStore,
+) -> int:
+    """Embed chunks in batches and store each batch as soon as it is ready.
+
+    Embedding runs in a worker thread and stays up to two batches ahead of
+    storage, so the model and the database work at the same time instead of
+    taking turns. Chunks whose text is already stored (by content hash)
+    reuse the vector stored by the same model instead of being embedded again.
+
+    Returns:
+        Number of chunks stored
+    """
+    known = await vector_store.get_embeddings_by_hash(
+        chunk_hashes, embedding_generator.model_name
+    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+    async def produce() -> None:
+        try:
+            for start in range(0, len(chunks), PIPELINE_BATCH_SIZE):
+                end = start + PIPELINE_BATCH_SIZE
+                embeddings = await asyncio.to_thread(
+                    embedding_generator.generate_missing_embeddings,
+                    chunk_texts[start:end],
+                    chunk_hashes[start:end],
+                    known,
+                )
+                await queue.put((start, embeddings))
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    stored = 0
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            start, embeddings = item
+            end = start + len(embeddings)
+            stored += await vector_store.store_document_chunks(
+                document_id,
+                chunks[start:end],
+                embeddings,
+                chunk_hashes[start:end],
+                embedding_generator.model_name,
+            )
+    finally:
+        producer.cancel()
+    return stored
+
 
 async def process_document_async(
     document_id: str,
@@ -70,37 +133,45 @@ async def process_document_async(
 
         # Step 2: Chunk the text
         logger.info("Step 2/4: Chunking document text")
-        text_chunker = TextChunker(
+        # CPU-bound (and the first chunker loads a tokenizer): keep it off the loop
+        text_chunker = await asyncio.to_thread(
+            TextChunker,
             chunk_size=config.chunk_size,
             chunk_overlap=config.chunk_overlap,
         )
-        chunks = text_chunker.chunk_document(processed_doc)
+        chunks = await asyncio.to_thread(text_chunker.chunk_document, processed_doc)
+        # The Docling tree is only needed for chunking; let it be freed now
+        processed_doc.docling_document = None
         logger.info("Created %d chunks from document", len(chunks))
-
-        # Step 3: Generate embeddings
-        logger.info("Step 3/4: Generating embeddings for chunks")
-        embedding_generator = EmbeddingGenerator.get_instance(config)
         chunk_texts = [chunk.text for chunk in chunks]
-        embeddings = embedding_generator.generate_batch_embeddings(chunk_texts)
-        logger.info("Generated embeddings with shape %s", embeddings.shape)
+        chunk_hashes = await asyncio.to_thread(
+            compute_content_hashes, [text.encode("utf-8") for text in chunk_texts]
+        )
 
-        # Step 4: Store chunks and embeddings
+        # Steps 3-4: Generate embeddings and store them, pipelined per batch
+        logger.info("Step 3/4: Generating embeddings for chunks")
         logger.info("Step 4/4: Storing chunks in vector store")
+        embedding_generator = EmbeddingGenerator.get_instance(config)
         vector_store = VectorStore(session)
-        chunk_count = await vector_store.store_document_chunks(
-            document_id, chunks, embeddings
+        chunk_count = await _embed_and_store(
+            document_id,
+            chunks,
+            chunk_texts,
+            chunk_hashes,
+            embedding_generator,
+            vector_store,
         )
         logger.info("Stored %d chunks in vector store", chunk_count)
 
-        # Update document status to "ready"
-        stmt = select(Document).where(Document.id == document_id)
-        result = await session.execute(stmt)
-        document = result.scalar_one_or_none()
+        # Update document status to "ready" in the same transaction as the
+        # flushed chunks
+        result = await session.execute(
+            update(Document)
+            .where(Document.id == document_id)
+            .values(status="ready", chunk_count=chunk_count, error_message=None)
+        )
 
-        if document:
-            document.status = "ready"
-            document.chunk_count = chunk_count
-            document.error_message = None
+        if result.rowcount:
             await session.commit()
             logger.info("Document %s processing completed successfully", document_id)
         else:
@@ -120,13 +191,15 @@ async def process_document_async(
 
         # Update document status to "failed" with error message
         try:
-            stmt = select(Document).where(Document.id == document_id)
-            result = await session.execute(stmt)
-            document = result.scalar_one_or_none()
+            # Drop any chunks flushed before the failure
+            await session.rollback()
+            result = await session.execute(
+                update(Document)
+                .where(Document.id == document_id)
+                .values(status="failed", error_message=str(e))
+            )
 
-            if document:
-                document.status = "failed"
-                document.error_message = str(e)
+            if result.rowcount:
                 await session.commit()
                 logger.info(
                     "Document %s marked as failed with error: %s",
@@ -1,14 +1,24 @@
 """RAG retriever orchestration module."""
 
 import logging
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Optional
 
+import numpy as np
+
 from .embeddings import EmbeddingGenerator
 from .vector_store import RetrievedChunk, VectorStore
 
 logger = logging.getLogger(__name__)
 
+# LRU of query embeddings keyed by (embedding model, query); retrievers are
+# built per request, so the cache lives at module level
+QUERY_EMBEDDING_CACHE_SIZE = 512
+_query_embeddings: "OrderedDict[tuple[str, str], np.ndarray]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
 
 @dataclass
 class RAGContext:
@@ -77,16 +87,17 @@ class RAGRetriever:
             "Retrieving context for query in conversation %s",
             conversation_id,
         )
-        print("[RAG] retriever invoked")
-        print(f"   conversation_id={conversation_id}")
-        print(f"   query_preview={query[:80].replace(chr(10), ' ')}")
-        print(
-            f"   top_k={top_k} min_similarity={min_similarity} document_id={document_id}"
+        logger.debug(
+            "Retriever query=%.80r top_k=%d min_similarity=%.2f document_id=%s",
+            query,
+            top_k,
+            min_similarity,
+            document_id,
         )
 
         try:
             # Generate query embedding
-            query_embedding = self.embedding_generator.generate_embedding(query)
+            query_embedding = await self.get_query_embedding(query)
 
             # Perform similarity search
             chunks = await self.vector_store.similarity_search(
@@ -99,7 +110,6 @@ class RAGRetriever:
 
             # Handle empty results gracefully
             if not chunks:
-                print("[RAG] retriever result: no chunks above threshold")
                 logger.info(
                     "No relevant chunks found for query in conversation %s",
                     conversation_id,
@@ -109,7 +119,6 @@ class RAGRetriever:
             # Format sources for Baguettotron
             formatted_sources = self.format_sources_for_baguettotron(chunks)
 
-            print(f"[RAG] retriever result: returning {len(chunks)} chunks")
             logger.info(
                 "Retrieved %d chunks for query in conversation %s",
                 len(chunks),
@@ -132,6 +141,34 @@ class RAGRetriever:
             # Return None to allow graceful degradation
             return None
 
+    async def get_query_embedding(self, query: str) -> np.ndarray:
+        """Embed a query, reusing the vector from a recent identical query.
+
+        Retries and repeated questions skip the embedding model entirely;
+        other queries are batched with concurrent ones by the generator's
+        coalescer. Cached arrays are marked read-only since they are shared.
+
+        Args:
+            query: User query text
+
+        Returns:
+            Numpy array of shape (dimension,) containing the embedding
+        """
+        key = (self.embedding_generator.model_name, query)
+        with _query_embeddings_lock:
+            embedding = _query_embeddings.get(key)
+            if embedding is not None:
+                _query_embeddings.move_to_end(key)
+                return embedding
+
+        embedding = await self.embedding_generator.coalescer.submit(query)
+        embedding.flags.writeable = False
+        with _query_embeddings_lock:
+            _query_embeddings[key] = embedding
+            while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                _query_embeddings.popitem(last=False)
+        return embedding
+
     def format_sources_for_baguettotron(self, chunks: list[RetrievedChunk]) -> str:
         """Format retrieved chunks in Baguettotron's XML source format.
 
@@ -157,11 +194,8 @@ class RAGRetriever:
         if not chunks:
             return ""
 
-        formatted_parts = []
-        for i, chunk in enumerate(chunks, start=1):
-            # Format each chunk with source_N tags
-            source_tag = f"<source_{i}>{chunk.text}</source_{i}>"
-            formatted_parts.append(source_tag)
-
-        # Join with newlines for readability
-        return "\n".join(formatted_parts)
+        # One source_N tag per chunk, joined with newlines for readability
+        return "\n".join([
+            f"<source_{i}>{chunk.text}</source_{i}>"
+            for i, chunk in enumerate(chunks, start=1)
+        ])
@@ -1,20 +1,150 @@
 """Vector store operations using sqlite-vec."""
 
+import asyncio
 import json
 import logging
+import os
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, ClassVar, Iterable, Optional, Sequence
 
 import numpy as np
-from sqlalchemy import select
+import torch
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from simsimd import cdist as simd_cdist
+except ImportError:
+    simd_cdist = None
+
 from ..db.models import Chunk, Document
+from ..services.model_utils import get_preferred_device
+from .ann_index import (
+    ANN_MIN_CHUNKS,
+    ANN_OVERSAMPLE,
+    ann_available,
+    build_index,
+    cache_index,
+    get_cached_index,
+)
 from .chunker import TextChunk
+from .simd_cos import dot_many
 
 logger = logging.getLogger(__name__)
 
+# Hashes per IN (...) lookup, well under SQLite's bound-parameter limit
+HASH_LOOKUP_BATCH_SIZE = 500
+# Rows fetched per round trip when streaming chunks into the scan buffer
+SCAN_BATCH_SIZE = 512
+# Embedding matrices kept for the NumPy scan, keyed by (conversation,
+# document filter, dimension)
+SCAN_CACHE_SIZE = 8
+# Candidates fetched from the int8 KNN per requested result, before the
+# exact float32 rescoring
+KNN_OVERSAMPLE = 2
+
+# Scans at least this large run on a CUDA/MPS device when one is present;
+# below it the host-device round trip costs more than the CPU product
+GPU_SCAN_MIN_CHUNKS = 20_000
+
+# (chunk count, latest upload) stamp, chunk ids, their embedding matrix and
+# its optional GPU copy
+_ScanEntry = tuple[tuple[Any, ...], list[str], np.ndarray, Optional[torch.Tensor]]
+_scan_cache: "OrderedDict[tuple[str, Optional[str], int], _ScanEntry]" = OrderedDict()
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """Return float32 embeddings scaled to unit L2 norm per row.
+
+    Stored embeddings are always unit-norm, so similarity search can score
+    chunks with a plain dot product.
+
+    Args:
+        embeddings: Array of shape (n, dimension)
+
+    Returns:
+        Float32 array of the same shape with unit-norm rows
+    """
+    embeddings = np.array(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10
+    return embeddings
+
+
+def _to_scan_device(matrix: np.ndarray) -> Optional[torch.Tensor]:
+    """Copy a large scan matrix to the GPU in fp16, or return None.
+
+    Kept alongside the cached host matrix, so repeat queries only move the
+    query vector to the device.
+    """
+    if len(matrix) < GPU_SCAN_MIN_CHUNKS:
+        return None
+    device = get_preferred_device()
+    if device.type not in ("cuda", "mps"):
+        return None
+    return torch.from_numpy(matrix).to(device, dtype=torch.float16)
+
+
+def new_chunk_ids(count: int) -> list[str]:
+    """Generate random (version 4) UUID strings from a single urandom call.
+
+    uuid.uuid4() reads the OS entropy source once per id; ingest needs one
+    id per chunk, so the bytes are drawn in one batch and sliced instead.
+    """
+    raw = os.urandom(16 * count)
+    return [
+        str(uuid.UUID(bytes=raw[i : i + 16], version=4))
+        for i in range(0, 16 * count, 16)
+    ]
+
+
+def dump_metadata(metadata: dict[str, Any]) -> str:
+    """Serialize chunk metadata to JSON text, with orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(metadata)
+
+
+def load_metadata(metadata_json: str) -> dict[str, Any]:
+    """Parse chunk metadata stored by dump_metadata."""
+    if orjson is not None:
+        return orjson.loads(metadata_json)
+    return json.loads(metadata_json)
+
+
+def quantize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """Quantize embeddings to int8 with a symmetric max-abs scale per row.
+
+    Cosine similarity ignores each vector's scale, so the scales are not
+    kept: the int8 rows alone rank chunks almost exactly like the float32
+    ones, at a quarter of the bytes.
+
+    Args:
+        embeddings: Array of shape (n, dimension) or (dimension,)
+
+    Returns:
+        Int8 array of the same shape
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scale = np.max(np.abs(embeddings), axis=-1, keepdims=True) / 127.0
+    return np.round(embeddings / (scale + 1e-10)).astype(np.int8)
+
+
+def vector_table_name(dimension: int) -> str:
+    """Name of the sqlite-vec KNN table for embeddings of a given dimension.
+
+    Keying the table by dimension keeps vectors from different embedding
+    models apart instead of failing inserts after a model change.
+    """
+    return f"chunks_vec_i8_{dimension}"
+
 
 @dataclass
 class RetrievedChunk:
@@ -28,16 +158,51 @@ class RetrievedChunk:
     chunk_index: int
 
 
+# Chunk columns a search result is built from
+RESULT_COLUMNS = (
+    Chunk.id,
+    Chunk.document_id,
+    Chunk.chunk_index,
+    Chunk.text,
+    Chunk.chunk_metadata,
+)
+
+
+def _retrieved_chunk(row: Sequence[Any], similarity: float) -> RetrievedChunk:
+    """Build a RetrievedChunk from a row starting with RESULT_COLUMNS."""
+    chunk_id, document_id, chunk_index, chunk_text, chunk_metadata = row[:5]
+    return RetrievedChunk(
+        chunk_id=chunk_id,
+        document_id=document_id,
+        text=chunk_text,
+        metadata=load_metadata(chunk_metadata),
+        similarity_score=float(similarity),
+        chunk_index=chunk_index,
+    )
+
+
 class VectorStore:
     """Manages vector storage and similarity search using sqlite-vec.
 
     This class handles storing document chunks with their embeddings
-    and performing cosine similarity search for RAG retrieval.
+    and performing cosine similarity search for RAG retrieval. Chunk
+    embeddings are mirrored into a sqlite-vec ``vec0`` table partitioned by
+    conversation, so searches run as KNN queries inside SQLite; when the
+    extension cannot be loaded, search falls back to scanning the chunk
+    embeddings in NumPy. The vec0 table holds int8-quantized copies of the
+    embeddings, and its nearest chunks are rescored exactly. With usearch
+    installed, conversations of at least ANN_MIN_CHUNKS chunks are searched
+    through an in-memory HNSW index.
 
     Attributes:
         session: SQLAlchemy async session for database operations
     """
 
+    # Set once sqlite-vec turns out to be unusable in this process
+    _vec_unavailable: ClassVar[bool] = False
+    # Dimensions whose vec0 table is known to exist
+    _vec_tables: ClassVar[set[int]] = set()
+
     def __init__(self, session: AsyncSession):
         """Initialize VectorStore with database session.
 
@@ -51,6 +216,8 @@ class VectorStore:
         document_id: str,
         chunks: list[TextChunk],
         embeddings: np.ndarray,
+        chunk_hashes: Optional[list[str]] = None,
+        embedding_model: Optional[str] = None,
     ) -> int:
         """Store chunks and embeddings in database.
 
@@ -58,6 +225,8 @@ class VectorStore:
             document_id: UUID of the parent document
             chunks: List of TextChunk objects
             embeddings: Numpy array of shape (len(chunks), dimension)
+            chunk_hashes: Optional SHA-256 digest of each chunk's text
+            embedding_model: Name of the model that produced the embeddings
 
         Returns:
             Number of chunks stored
@@ -73,39 +242,222 @@ class VectorStore:
 
         logger.info("Storing %d chunks for document %s", len(chunks), document_id)
 
-        # Create Chunk records
-        chunk_records = []
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk_id = str(uuid.uuid4())
-
-            # Serialize embedding to bytes
-            embedding_bytes = embedding.astype(np.float32).tobytes()
-
-            # Serialize metadata to JSON
-            metadata_json = json.dumps(chunk.metadata)
-
-            chunk_record = Chunk(
-                id=chunk_id,
-                document_id=document_id,
-                chunk_index=chunk.chunk_index,
-                text=chunk.text,
-                chunk_metadata=metadata_json,
-                embedding=embedding_bytes,
+        if chunk_hashes is None:
+            chunk_hashes = [None] * len(chunks)
+        embeddings = normalize_embeddings(embeddings)
+
+        # One executemany INSERT through Core: no per-row ORM state
+        chunk_rows = [
+            {
+                "id": chunk_id,
+                "document_id": document_id,
+                "chunk_index": chunk.chunk_index,
+                "text": chunk.text,
+                "chunk_metadata": dump_metadata(chunk.metadata),
+                "content_hash": chunk_hash,
+                "embedding_model": embedding_model,
+                "embedding": embedding.tobytes(),
+            }
+            for chunk_id, chunk, embedding, chunk_hash in zip(
+                new_chunk_ids(len(chunks)), chunks, embeddings, chunk_hashes
             )
-            chunk_records.append(chunk_record)
-
-        # Add all chunks to session
-        self.session.add_all(chunk_records)
-        await self.session.flush()
+        ]
+        if chunk_rows:
+            await self.session.execute(insert(Chunk), chunk_rows)
+        await self.index_chunk_vectors(
+            document_id, [row["id"] for row in chunk_rows], embeddings
+        )
 
         # Commit is handled by caller
         logger.info(
             "Successfully stored %d chunks for document %s",
-            len(chunk_records),
+            len(chunk_rows),
             document_id,
         )
 
-        return len(chunk_records)
+        return len(chunk_rows)
+
+    def _disable_vector_index(self, error: Exception) -> None:
+        VectorStore._vec_unavailable = True
+        logger.warning(
+            "⚠️  sqlite-vec unavailable, using NumPy similarity search: %s", error
+        )
+
+    async def _ensure_vector_table(self, dimension: int) -> str:
+        table = vector_table_name(dimension)
+        if dimension not in VectorStore._vec_tables:
+            await self.session.execute(
+                text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING vec0("
+                    "chunk_id text primary key, "
+                    f"embedding int8[{dimension}] distance_metric=cosine, "
+                    "conversation_id text partition key, "
+                    "document_id text)"
+                )
+            )
+            VectorStore._vec_tables.add(dimension)
+        return table
+
+    async def index_chunk_vectors(
+        self, document_id: str, chunk_ids: list[str], embeddings: np.ndarray
+    ) -> None:
+        """Add stored chunk embeddings to the sqlite-vec KNN table.
+
+        Runs in the caller's transaction. Does nothing when sqlite-vec is
+        unavailable; similarity search then scans the chunks table instead.
+
+        Args:
+            document_id: UUID of the parent document
+            chunk_ids: IDs of the stored chunks, aligned with embeddings
+            embeddings: Unit-norm float32 array of shape (len(chunk_ids), dim)
+        """
+        if VectorStore._vec_unavailable or not chunk_ids:
+            return
+
+        conversation_id = await self.session.scalar(
+            select(Document.conversation_id).where(Document.id == document_id)
+        )
+        try:
+            table = await self._ensure_vector_table(embeddings.shape[1])
+            await self.session.execute(
+                text(
+                    f"INSERT INTO {table} "
+                    "(chunk_id, embedding, conversation_id, document_id) "
+                    "VALUES "
+                    "(:chunk_id, vec_int8(:embedding), :conversation_id, :document_id)"
+                ),
+                [
+                    {
+                        "chunk_id": chunk_id,
+                        "embedding": embedding.tobytes(),
+                        "conversation_id": conversation_id,
+                        "document_id": document_id,
+                    }
+                    for chunk_id, embedding in zip(
+                        chunk_ids, quantize_embeddings(embeddings)
+                    )
+                ],
+            )
+        except OperationalError as e:
+            self._disable_vector_index(e)
+
+    async def delete_conversation_vectors(self, conversation_id: str) -> None:
+        """Drop a conversation's partition from the sqlite-vec KNN tables.
+
+        Runs in the caller's transaction; deleting the conversation cascades
+        to its chunks but not to their vectors in the virtual table.
+
+        Args:
+            conversation_id: UUID of the conversation being deleted
+        """
+        if VectorStore._vec_unavailable:
+            return
+        try:
+            for dimension in VectorStore._vec_tables:
+                await self.session.execute(
+                    text(
+                        f"DELETE FROM {vector_table_name(dimension)} "
+                        "WHERE conversation_id = :conversation_id"
+                    ),
+                    {"conversation_id": conversation_id},
+                )
+        except OperationalError as e:
+            self._disable_vector_index(e)
+
+    async def sync_vector_index(self, dimension: int) -> None:
+        """Bring the sqlite-vec KNN table in line with the chunks table.
+
+        Indexes chunks stored before the table existed (or while sqlite-vec
+        was unavailable) and drops vectors whose chunks were deleted without
+        going through delete_conversation_vectors. Commits on success.
+
+        Args:
+            dimension: Embedding dimension of the active embedding model
+        """
+        if VectorStore._vec_unavailable:
+            return
+        try:
+            table = await self._ensure_vector_table(dimension)
+            await self.session.execute(
+                text(
+                    f"DELETE FROM {table} WHERE chunk_id NOT IN (SELECT id FROM chunks)"
+                )
+            )
+            missing = (
+                await self.session.execute(
+                    text(
+                        "SELECT c.id, c.embedding, d.conversation_id, c.document_id "
+                        "FROM chunks c JOIN documents d ON d.id = c.document_id "
+                        "WHERE length(c.embedding) = :size "
+                        f"AND c.id NOT IN (SELECT chunk_id FROM {table})"
+                    ),
+                    {"size": dimension * 4},
+                )
+            ).all()
+            if missing:
+                quantized = quantize_embeddings(
+                    np.frombuffer(
+                        b"".join([row[1] for row in missing]), dtype=np.float32
+                    ).reshape(-1, dimension)
+                )
+                await self.session.execute(
+                    text(
+                        f"INSERT INTO {table} "
+                        "(chunk_id, embedding, conversation_id, document_id) "
+                        "VALUES (:chunk_id, vec_int8(:embedding), "
+                        ":conversation_id, :document_id)"
+                    ),
+                    [
+                        {
+                            "chunk_id": chunk_id,
+                            "embedding": embedding.tobytes(),
+                            "conversation_id": conversation_id,
+                            "document_id": document_id,
+                        }
+                        for (
+                            chunk_id,
+                            _,
+                            conversation_id,
+                            document_id,
+                        ), embedding in zip(missing, quantized)
+                    ],
+                )
+            await self.session.commit()
+        except OperationalError as e:
+            await self.session.rollback()
+            self._disable_vector_index(e)
+
+    async def get_embeddings_by_hash(
+        self, hashes: Iterable[str], embedding_model: str
+    ) -> dict[str, np.ndarray]:
+        """Look up stored embeddings for chunks with the given content hashes.
+
+        Only vectors produced by embedding_model are returned; another model's
+        vectors can share the dimension but live in a different space.
+
+        Args:
+            hashes: SHA-256 digests of chunk texts
+            embedding_model: Name of the model the vectors must come from
+
+        Returns:
+            Mapping of each hash that is already stored to its embedding
+        """
+        unique_hashes = list(set(hashes))
+        found: dict[str, np.ndarray] = {}
+        for start in range(0, len(unique_hashes), HASH_LOOKUP_BATCH_SIZE):
+            batch = unique_hashes[start : start + HASH_LOOKUP_BATCH_SIZE]
+            result = await self.session.execute(
+                select(Chunk.content_hash, Chunk.embedding).where(
+                    Chunk.content_hash.in_(batch),
+                    Chunk.embedding_model == embedding_model,
+                )
+            )
+            for content_hash, embedding_bytes in result:
+                if content_hash not in found:
+                    found[content_hash] = np.frombuffer(
+                        embedding_bytes, dtype=np.float32
+                    )
+        return found
 
     async def similarity_search(
         self,
@@ -140,112 +492,351 @@ class VectorStore:
             document_id,
         )
 
-        # Build query with manual cosine similarity calculation
-        # Since sqlite-vec might not be available, we'll compute
-        # similarity in Python
-        query_stmt = (
-            select(Chunk, Document.conversation_id)
-            .join(Document, Chunk.document_id == Document.id)
-            .where(Document.conversation_id == conversation_id)
-        )
-
+        if document_id is None and ann_available():
+            results = await self._ann_search(
+                query_embedding, conversation_id, top_k, min_similarity
+            )
+            if results is not None:
+                return results
+
+        if not VectorStore._vec_unavailable:
+            try:
+                return await self._knn_search(
+                    query_embedding,
+                    conversation_id,
+                    top_k,
+                    min_similarity,
+                    document_id,
+                )
+            except OperationalError as e:
+                self._disable_vector_index(e)
+
+        # Without sqlite-vec, score every chunk of the conversation in NumPy.
+        # Plain column rows skip ORM hydration and identity-map bookkeeping.
+        dimension = query_embedding.shape[0]
+        conditions = [
+            Document.conversation_id == conversation_id,
+            Document.status == "ready",
+            func.length(Chunk.embedding) == dimension * 4,
+        ]
         if document_id:
-            query_stmt = query_stmt.where(Document.id == document_id)
-
-        result = await self.session.execute(query_stmt)
-        rows = result.all()
+            conditions.append(Document.id == document_id)
 
-        if not rows:
+        count, last_upload = (
+            await self.session.execute(
+                select(func.count(Chunk.id), func.max(Document.upload_timestamp))
+                .join(Document, Chunk.document_id == Document.id)
+                .where(*conditions)
+            )
+        ).one()
+        if not count:
             logger.info("No chunks found for conversation %s", conversation_id)
             return []
 
-        # Compute cosine similarity for each chunk
-        candidates: list[RetrievedChunk] = []
-        all_candidates: list[RetrievedChunk] = []
-        for chunk, _ in rows:
-            # Deserialize embedding from bytes
-            chunk_embedding = np.frombuffer(chunk.embedding, dtype=np.float32)
-
-            # Compute cosine similarity
-            similarity = self._cosine_similarity(query_embedding, chunk_embedding)
-            # Deserialize metadata (needed for debug + potential fallback)
-            metadata = json.loads(chunk.chunk_metadata)
-
-            retrieved_chunk = RetrievedChunk(
-                chunk_id=chunk.id,
-                document_id=chunk.document_id,
-                text=chunk.text,
-                metadata=metadata,
-                similarity_score=similarity,
-                chunk_index=chunk.chunk_index,
-            )
-            all_candidates.append(retrieved_chunk)
-
-            # Filter by minimum similarity for primary results
-            if similarity >= min_similarity:
-                candidates.append(retrieved_chunk)
-
-        # Log top similarities even if they are below the threshold to aid debugging
-        all_candidates.sort(key=lambda x: x.similarity_score, reverse=True)
-        if all_candidates:
-            top_preview = all_candidates[: min(3, len(all_candidates))]
-            print(
-                "[RAG] similarity debug: top scores (similarity, chunk_id, idx, doc_id, text_preview)"
-            )
-            for rc in top_preview:
-                preview = rc.text[:80].replace("\n", " ")
-                print(
-                    f"   {rc.similarity_score:.4f} | {rc.chunk_id} | chunk#{rc.chunk_index} | doc:{rc.document_id} | {preview}"
-                )
+        # Repeat questions in a conversation reuse its cached matrix; the
+        # stamp changes whenever a document is added or removed
+        cache_key = (conversation_id, document_id, dimension)
+        stamp = (count, last_upload)
+        cached = _scan_cache.get(cache_key)
+        if cached is not None and cached[0] == stamp:
+            _scan_cache.move_to_end(cache_key)
+            _, chunk_ids, matrix, device_matrix = cached
         else:
-            print("[RAG] similarity debug: no chunks found to score")
+            # Stream embeddings straight into one preallocated (N, D) matrix
+            # of unit-norm rows, keeping only each row's chunk id
+            matrix = np.empty((count, dimension), dtype=np.float32)
+            chunk_ids: list[str] = []
+            stream = await self.session.stream(
+                select(Chunk.id, Chunk.embedding)
+                .join(Document, Chunk.document_id == Document.id)
+                .where(*conditions)
+                .execution_options(yield_per=SCAN_BATCH_SIZE)
+            )
+            try:
+                # One buffer conversion per fetched batch rather than per chunk
+                async for partition in stream.partitions():
+                    batch = partition[: count - len(chunk_ids)]
+                    start = len(chunk_ids)
+                    matrix[start : start + len(batch)] = np.frombuffer(
+                        b"".join([embedding for _, embedding in batch]),
+                        dtype=np.float32,
+                    ).reshape(len(batch), dimension)
+                    chunk_ids.extend([chunk_id for chunk_id, _ in batch])
+                    if len(chunk_ids) == count:
+                        break
+            finally:
+                # Breaking out leaves the cursor open, and with it SQLite's
+                # read lock for as long as this session lives
+                await stream.close()
+            matrix = matrix[: len(chunk_ids)]
+            device_matrix = _to_scan_device(matrix)
+            matrix.flags.writeable = False
+            _scan_cache[cache_key] = (stamp, chunk_ids, matrix, device_matrix)
+            _scan_cache.move_to_end(cache_key)
+            while len(_scan_cache) > SCAN_CACHE_SIZE:
+                _scan_cache.popitem(last=False)
+
+        # Score every chunk at once with a single matrix-vector product
+        # instead of a Python loop per chunk
+        similarities = self._cosine_similarities(query_embedding, matrix, device_matrix)
+
+        # Rank by index only; result columns are read (and metadata parsed)
+        # just for the chunks that are returned. argpartition finds the
+        # best k in O(N); only those k are sorted.
+        k = min(max(top_k, 3), len(similarities))
+        ranked = np.argpartition(-similarities, k - 1)[:k]
+        ranked = ranked[np.argsort(-similarities[ranked], kind="stable")]
+        result = await self.session.execute(
+            select(*RESULT_COLUMNS).where(Chunk.id.in_([chunk_ids[i] for i in ranked]))
+        )
+        rows_by_id = {row.id: row for row in result}
+        ranked = np.array([i for i in ranked if chunk_ids[i] in rows_by_id], dtype=int)
+
+        # Log top similarities even if they are below the threshold to aid
+        # debugging; previews are only rendered when DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Similarity debug: top scores "
+                "(similarity, chunk_id, idx, doc_id, text_preview)"
+            )
+            for i in ranked[:3]:
+                row = rows_by_id[chunk_ids[i]]
+                logger.debug(
+                    "   %.4f | %s | chunk#%d | doc:%s | %s",
+                    similarities[i],
+                    row.id,
+                    row.chunk_index,
+                    row.document_id,
+                    row.text[:80].replace("\n", " "),
+                )
 
+        selected = ranked[similarities[ranked] >= min_similarity][:top_k]
         fallback_used = False
         # Degrade gracefully: if nothing cleared the threshold but we have candidates,
         # return the top_k lowest-threshold chunks so the model still sees context.
-        if not candidates and all_candidates:
-            print(
-                f"[RAG] similarity debug: no chunks >= {min_similarity}, falling back to top {top_k} results"
+        if not len(selected):
+            logger.debug(
+                "Similarity debug: no chunks >= %s, falling back to top %d results",
+                min_similarity,
+                top_k,
             )
-            candidates = all_candidates[:top_k]
+            selected = ranked[:top_k]
             fallback_used = True
 
-        # Sort by similarity (descending) and limit to top_k
-        candidates.sort(key=lambda x: x.similarity_score, reverse=True)
-        results = candidates[:top_k]
+        results = [
+            _retrieved_chunk(rows_by_id[chunk_ids[i]], similarities[i])
+            for i in selected
+        ]
 
         if fallback_used:
             logger.info(
                 "Fell back to top_%d chunks (threshold %.2f not met) from %d total chunks",
                 len(results),
                 min_similarity,
-                len(rows),
+                len(chunk_ids),
             )
         else:
             logger.info(
                 "Found %d chunks above threshold (%.2f) from %d total chunks",
                 len(results),
                 min_similarity,
-                len(rows),
+                len(chunk_ids),
             )
 
         return results
 
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
-        """Compute cosine similarity between two vectors.
+    async def _knn_search(
+        self,
+        query_embedding: np.ndarray,
+        conversation_id: str,
+        top_k: int,
+        min_similarity: float,
+        document_id: Optional[str],
+    ) -> list[RetrievedChunk]:
+        """Run the top-k search as a sqlite-vec KNN query.
 
-        Args:
-            vec1: First vector
-            vec2: Second vector
+        The int8 KNN picks top_k * KNN_OVERSAMPLE candidates, which are then
+        rescored against their float32 embeddings.
+        """
+        query = query_embedding.astype(np.float32)
+        table = await self._ensure_vector_table(query.shape[0])
+        knn_sql = (
+            f"SELECT chunk_id, distance FROM {table} "
+            "WHERE embedding MATCH vec_int8(:query) AND k = :k "
+            "AND conversation_id = :conversation_id"
+        )
+        params: dict[str, Any] = {
+            "query": quantize_embeddings(query).tobytes(),
+            "k": top_k * KNN_OVERSAMPLE,
+            "conversation_id": conversation_id,
+        }
+        if document_id:
+            knn_sql += " AND document_id = :document_id"
+            params["document_id"] = document_id
 
-        Returns:
-            Cosine similarity in range [-1, 1]
+        hits = (await self.session.execute(text(knn_sql), params)).all()
+        return await self._load_ranked(
+            [(chunk_id, 1.0 - distance) for chunk_id, distance in hits],
+            conversation_id,
+            top_k,
+            min_similarity,
+            "sqlite-vec",
+            rescore_query=query,
+        )
+
+    async def _ann_search(
+        self,
+        query_embedding: np.ndarray,
+        conversation_id: str,
+        top_k: int,
+        min_similarity: float,
+    ) -> Optional[list[RetrievedChunk]]:
+        """Search a large conversation through its in-memory HNSW index.
+
+        Returns None for conversations below ANN_MIN_CHUNKS so the caller
+        runs an exact search instead. The index is rebuilt whenever the
+        conversation's chunk count or latest upload changes.
+        """
+        dimension = query_embedding.shape[0]
+        chunk_count, last_upload = (
+            await self.session.execute(
+                select(func.count(Chunk.id), func.max(Document.upload_timestamp))
+                .join(Document, Chunk.document_id == Document.id)
+                .where(
+                    Document.conversation_id == conversation_id,
+                    Document.status == "ready",
+                )
+            )
+        ).one()
+        if chunk_count < ANN_MIN_CHUNKS:
+            return None
+
+        stamp = (chunk_count, last_upload, dimension)
+        conversation_index = get_cached_index(conversation_id, stamp)
+        if conversation_index is None:
+            result = await self.session.execute(
+                select(Chunk.id, Chunk.embedding)
+                .join(Document, Chunk.document_id == Document.id)
+                .where(
+                    Document.conversation_id == conversation_id,
+                    Document.status == "ready",
+                    func.length(Chunk.embedding) == dimension * 4,
+                )
+            )
+            rows = result.all()
+            if not rows:
+                return None
+            embeddings = np.frombuffer(
+                b"".join([embedding for _, embedding in rows]), dtype=np.float32
+            ).reshape(-1, dimension)
+            conversation_index = await asyncio.to_thread(
+                build_index, stamp, [chunk_id for chunk_id, _ in rows], embeddings
+            )
+            cache_index(conversation_id, conversation_index)
+
+        return await self._load_ranked(
+            conversation_index.search(query_embedding, top_k * ANN_OVERSAMPLE),
+            conversation_id,
+            top_k,
+            min_similarity,
+            "HNSW index",
+        )
+
+    async def _load_ranked(
+        self,
+        hits: list[tuple[str, float]],
+        conversation_id: str,
+        top_k: int,
+        min_similarity: float,
+        source: str,
+        rescore_query: Optional[np.ndarray] = None,
+    ) -> list[RetrievedChunk]:
+        """Turn ranked (chunk_id, similarity) hits into RetrievedChunks.
+
+        Only the hit chunks are read back from the chunks table; the
+        threshold and top-k fallback match the NumPy scan. With
+        rescore_query, approximate similarities are replaced by exact ones
+        computed from the stored embeddings and the hits re-ranked.
         """
-        # Normalize vectors
-        vec1_norm = vec1 / (np.linalg.norm(vec1) + 1e-10)
-        vec2_norm = vec2 / (np.linalg.norm(vec2) + 1e-10)
+        columns = list(RESULT_COLUMNS)
+        if rescore_query is not None:
+            columns.append(Chunk.embedding)
+        result = await self.session.execute(
+            select(*columns).where(Chunk.id.in_([chunk_id for chunk_id, _ in hits]))
+        )
+        rows_by_id = {row.id: row for row in result}
+
+        scored = [
+            (rows_by_id[chunk_id], similarity)
+            for chunk_id, similarity in hits
+            if chunk_id in rows_by_id
+        ]
+        if rescore_query is not None and scored:
+            similarities = self._cosine_similarities(
+                rescore_query,
+                np.frombuffer(
+                    b"".join([row.embedding for row, _ in scored]), dtype=np.float32
+                ).reshape(len(scored), -1),
+            )
+            order = np.argsort(-similarities, kind="stable")
+            scored = [(scored[i][0], float(similarities[i])) for i in order]
+        if not scored:
+            logger.info("No chunks found for conversation %s", conversation_id)
+            return []
 
-        # Compute dot product
-        similarity = np.dot(vec1_norm, vec2_norm)
+        selected = [item for item in scored if item[1] >= min_similarity][:top_k]
+        if selected:
+            logger.info(
+                "Found %d chunks above threshold (%.2f) via %s",
+                len(selected),
+                min_similarity,
+                source,
+            )
+        else:
+            # Degrade gracefully, as in the scan: return the nearest chunks
+            selected = scored[:top_k]
+            logger.info(
+                "Fell back to top_%d chunks (threshold %.2f not met) via %s",
+                len(selected),
+                min_similarity,
+                source,
+            )
+
+        return [_retrieved_chunk(row, similarity) for row, similarity in selected]
+
+    def _cosine_similarities(
+        self,
+        query_embedding: np.ndarray,
+        matrix: np.ndarray,
+        device_matrix: Optional[torch.Tensor] = None,
+    ) -> np.ndarray:
+        """Compute cosine similarity between a query and packed embeddings.
+
+        Stored embeddings are unit-norm (see normalize_embeddings), so only
+        the query is normalized and each similarity is a dot product. Uses
+        SimSIMD's runtime-dispatched kernels when it is installed, then a
+        Numba-compiled loop, then NumPy's BLAS matrix-vector product. With
+        device_matrix, the product runs on the GPU instead.
 
-        return float(similarity)
+        Args:
+            query_embedding: Query vector of shape (dimension,)
+            matrix: C-contiguous float32 unit-norm chunk embeddings, (N, dimension)
+            device_matrix: Optional fp16 copy of matrix on a CUDA/MPS device
+
+        Returns:
+            Array of cosine similarities in range [-1, 1], one per chunk
+        """
+        query = query_embedding.astype(np.float32)
+        query /= np.linalg.norm(query) + 1e-10
+        if device_matrix is not None:
+            device_query = torch.from_numpy(query).to(
+                device_matrix.device, dtype=device_matrix.dtype
+            )
+            return (device_matrix @ device_query).float().cpu().numpy()
+        if simd_cdist is not None:
+            return np.asarray(
+                simd_cdist(query[None, :], matrix, metric="dot"), dtype=np.float32
+            ).ravel()
+        if dot_many is not None:
+            return dot_many(query, matrix)
+        return matrix @ query
@@ -1,5 +1,6 @@
 """Pydantic models for API requests and responses."""
 
+from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel, field_validator
 
@@ -15,8 +16,8 @@ class ClientResponse(BaseModel):
     repetition_penalty: float | None
     do_sample: bool | None
     max_tokens: int | None
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
     class Config:
         from_attributes = True
@@ -81,9 +82,9 @@ class ConversationUpdate(BaseModel):
 class ConversationResponse(BaseModel):
     id: str  # UUID
     title: str
-    created_at: str
-    updated_at: str
-    last_accessed_at: str
+    created_at: datetime
+    updated_at: datetime
+    last_accessed_at: datetime
     message_count: Optional[int] = None
 
     class Config:
@@ -94,7 +95,7 @@ class MessageResponse(BaseModel):
     role: str
     content: str
     thinking: str | None = None
-    created_at: str
+    created_at: datetime
 
     class Config:
         from_attributes = True
@@ -103,9 +104,9 @@ class MessageResponse(BaseModel):
 class ConversationDetailResponse(BaseModel):
     id: str  # UUID
     title: str
-    created_at: str
-    updated_at: str
-    last_accessed_at: str
+    created_at: datetime
+    updated_at: datetime
+    last_accessed_at: datetime
     messages: List[MessageResponse]
 
     class Config:
@@ -147,7 +148,7 @@ class DocumentResponse(BaseModel):
     filename: str
     status: str  # "processing" | "ready" | "failed"
     chunk_count: int
-    upload_timestamp: str
+    upload_timestamp: datetime
     error_message: str | None = None
     sse_url: str | None = None
 
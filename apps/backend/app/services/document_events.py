@@ -1,43 +1,86 @@
 import asyncio
 from collections import defaultdict, deque
+from itertools import islice
 from typing import Any
 
+# Events kept per document. The buffer doubles as replay history for late
+# subscribers; a consumer that falls further behind skips the oldest events.
+EVENT_BUFFER_SIZE = 256
+
+
+class _DocumentStream:
+    """Append-only ring buffer of one document's events plus a wakeup."""
+
+    __slots__ = ("events", "seq", "changed", "subscribers")
+
+    def __init__(self) -> None:
+        self.events: deque[dict[str, Any]] = deque(maxlen=EVENT_BUFFER_SIZE)
+        # Total number of events ever appended
+        self.seq = 0
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+
+
 # Simple in-memory pub/sub for document status events.
-_subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
-# Keep a small history so late subscribers can replay recent stages.
-_history: dict[str, deque] = defaultdict(lambda: deque(maxlen=50))
+_streams: dict[str, _DocumentStream] = defaultdict(_DocumentStream)
 
 
-async def subscribe(document_id: str) -> asyncio.Queue:
-    """Subscribe to document events; returns an asyncio.Queue of event dicts."""
-    queue: asyncio.Queue = asyncio.Queue()
-    _subscribers[document_id].add(queue)
-    return queue
+class Subscription:
+    """A reader's cursor into a document's event stream."""
 
+    def __init__(self, document_id: str, stream: _DocumentStream) -> None:
+        self.document_id = document_id
+        self._stream = stream
+        # Start at the oldest buffered event so recent stages are replayed
+        self._cursor = stream.seq - len(stream.events)
 
-def unsubscribe(document_id: str, queue: asyncio.Queue) -> None:
-    """Unsubscribe a previously registered queue."""
-    queues = _subscribers.get(document_id)
-    if not queues:
+    async def next_events(self, timeout: float) -> list[dict[str, Any]]:
+        """Return events past the cursor, waiting up to timeout for new ones.
+
+        Returns an empty list if nothing arrives in time.
+        """
+        stream = self._stream
+        if stream.seq == self._cursor:
+            try:
+                await asyncio.wait_for(stream.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        pending = min(stream.seq - self._cursor, len(stream.events))
+        self._cursor = stream.seq
+        return list(islice(stream.events, len(stream.events) - pending, None))
+
+
+def subscribe(document_id: str) -> Subscription:
+    """Subscribe to document events, starting with the buffered history."""
+    stream = _streams[document_id]
+    stream.subscribers += 1
+    return Subscription(document_id, stream)
+
+
+def unsubscribe(subscription: Subscription) -> None:
+    """Release a subscription; the last one frees the document's buffer."""
+    stream = _streams.get(subscription.document_id)
+    if stream is None:
         return
-    queues.discard(queue)
-    if not queues:
-        _subscribers.pop(document_id, None)
-        _history.pop(document_id, None)
+    stream.subscribers -= 1
+    if stream.subscribers <= 0:
+        _streams.pop(subscription.document_id, None)
 
 
 async def broadcast(document_id: str, event: dict[str, Any]) -> None:
-    """Broadcast an event to all subscribers for a document."""
-    _history[document_id].append(event)
-    queues = list(_subscribers.get(document_id, []))
-    for q in queues:
-        try:
-            q.put_nowait(event)
-        except asyncio.QueueFull:
-            # Drop if the consumer is too slow.
-            continue
+    """Broadcast an event to all subscribers for a document.
+
+    Appends to the document's buffer and wakes every waiting subscriber with
+    a single Event.set(), however many there are.
+    """
+    stream = _streams[document_id]
+    stream.events.append(event)
+    stream.seq += 1
+    stream.changed.set()
+    stream.changed.clear()
 
 
 def get_history(document_id: str) -> list[dict[str, Any]]:
     """Return a copy of recent events for a document."""
-    return list(_history.get(document_id, []))
+    stream = _streams.get(document_id)
+    return list(stream.events) if stream else []
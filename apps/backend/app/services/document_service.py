@@ -1,18 +1,26 @@
-import json
-import uuid
+import asyncio
+import logging
 from pathlib import Path
 
-from sqlalchemy import select
+from sqlalchemy import exists, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db.models import Chunk, Document
 from ..db.session import async_session
 from ..rag.chunker import TextChunker
 from ..rag.config import RAGConfig
-from ..rag.document_processor import DocumentProcessor
+from ..rag.document_processor import DocumentProcessor, compute_content_hashes
 from ..rag.embeddings import EmbeddingGenerator
+from ..rag.vector_store import (
+    VectorStore,
+    dump_metadata,
+    new_chunk_ids,
+    normalize_embeddings,
+)
 from .document_events import broadcast
 
+logger = logging.getLogger(__name__)
+
 
 async def process_document_background(
     document_id: str, file_path: Path, conversation_id: str, filename: str
@@ -26,7 +34,7 @@ async def process_document_background(
     )
 
     try:
-        print(f"[DOC PIPELINE] 🚀 Start processing document {document_id} ({filename})")
+        logger.info("🚀 Start processing document %s (%s)", document_id, filename)
         await broadcast(
             document_id,
             {
@@ -42,8 +50,11 @@ async def process_document_background(
 
         # 2. Extract text
         processed_doc = await processor.process_document(file_path, filename)
-        print(
-            f"[DOC PIPELINE] ✅ Docling complete for {document_id} | chars={len(processed_doc.text)} tables={len(processed_doc.tables)}"
+        logger.info(
+            "✅ Docling complete for %s | chars=%d tables=%d",
+            document_id,
+            len(processed_doc.text),
+            len(processed_doc.tables),
         )
         await broadcast(
             document_id,
@@ -58,33 +69,38 @@ async def process_document_background(
 
         # 2.5 Check for duplicates
         async with async_session() as session:
-            # Check if document with same hash exists in this conversation
+            # Check if document with same hash exists in this conversation.
+            # Earlier duplicates are marked ready too, so take any one match.
             result = await session.execute(
-                select(Document)
+                select(Document.id, Document.filename, Document.chunk_count)
                 .where(Document.conversation_id == conversation_id)
                 .where(Document.content_hash == processed_doc.content_hash)
                 .where(Document.status == "ready")
                 .where(Document.id != document_id)  # Exclude current doc
+                .limit(1)
             )
-            existing_doc = result.scalar_one_or_none()
+            existing_doc = result.first()
 
             if existing_doc:
-                print(
-                    f"[DOC PIPELINE] ♻️ Duplicate detected: {existing_doc.filename} ({existing_doc.id})"
+                logger.info(
+                    "♻️ Duplicate detected: %s (%s)",
+                    existing_doc.filename,
+                    existing_doc.id,
                 )
 
                 # Silent success: Mark as ready but skip processing
                 # We copy the chunk count so the UI looks correct
-                result = await session.execute(
-                    select(Document).where(Document.id == document_id)
+                await session.execute(
+                    update(Document)
+                    .where(Document.id == document_id)
+                    .values(
+                        status="ready",
+                        chunk_count=existing_doc.chunk_count,
+                        content_hash=processed_doc.content_hash,
+                        error_message=None,
+                    )
                 )
-                current_doc = result.scalar_one_or_none()
-                if current_doc:
-                    current_doc.status = "ready"
-                    current_doc.chunk_count = existing_doc.chunk_count
-                    current_doc.content_hash = processed_doc.content_hash
-                    current_doc.error_message = None
-                    await session.commit()
+                await session.commit()
 
                 # Broadcast success event so frontend updates normally
                 await broadcast(
@@ -97,20 +113,35 @@ async def process_document_background(
                         "chunk_count": existing_doc.chunk_count,
                     },
                 )
-                print(
-                    f"[DOC PIPELINE] ⏭️ Skipped processing for duplicate {document_id} -> marked as ready"
+                logger.info(
+                    "⏭️ Skipped processing for duplicate %s -> marked as ready",
+                    document_id,
                 )
                 return
 
         # 3. Chunk text using structured splitter (reduces mid-word splits)
-        text_chunker = TextChunker(
-            chunk_size=rag_config.chunk_size, chunk_overlap=rag_config.chunk_overlap
+        # CPU-bound (and the first chunker loads a tokenizer): keep it off the loop
+        text_chunker = await asyncio.to_thread(
+            TextChunker,
+            chunk_size=rag_config.chunk_size,
+            chunk_overlap=rag_config.chunk_overlap,
         )
-        chunks = text_chunker.chunk_document(processed_doc)
+        chunks = await asyncio.to_thread(text_chunker.chunk_document, processed_doc)
+        # The Docling tree is only needed for chunking; let it be freed now
+        processed_doc.docling_document = None
         chunks_text = [chunk.text for chunk in chunks]
-        print(
-            f"[DOC PIPELINE] ✅ Chunking complete for {document_id} | chunks={len(chunks_text)} (avg {sum(len(c) for c in chunks_text) // len(chunks_text) if chunks_text else 0} chars)"
+        chunk_hashes = await asyncio.to_thread(
+            compute_content_hashes, [text.encode("utf-8") for text in chunks_text]
         )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "✅ Chunking complete for %s | chunks=%d (avg %d chars)",
+                document_id,
+                len(chunks_text),
+                sum(len(c) for c in chunks_text) // len(chunks_text)
+                if chunks_text
+                else 0,
+            )
         await broadcast(
             document_id,
             {
@@ -123,9 +154,22 @@ async def process_document_background(
 
         # 4. Generate embeddings
         if embedding_generator and chunks_text:
-            embeddings = embedding_generator.generate_batch_embeddings(chunks_text)
-            print(
-                f"[DOC PIPELINE] ✅ Embedding complete for {document_id} | vectors={len(embeddings)}"
+            # Chunks already stored elsewhere reuse their vectors
+            async with async_session() as session:
+                known = await VectorStore(session).get_embeddings_by_hash(
+                    chunk_hashes, embedding_generator.model_name
+                )
+            embeddings = await asyncio.to_thread(
+                embedding_generator.generate_missing_embeddings,
+                chunks_text,
+                chunk_hashes,
+                known,
+            )
+            embeddings = normalize_embeddings(embeddings)
+            logger.info(
+                "✅ Embedding complete for %s | vectors=%d",
+                document_id,
+                len(embeddings),
             )
             await broadcast(
                 document_id,
@@ -138,8 +182,10 @@ async def process_document_background(
             )
         else:
             embeddings = []
-            print(
-                f"[DOC PIPELINE] ⚠️ Embedding skipped for {document_id} | reason={'no_embedding_generator' if not embedding_generator else 'no_chunks'}"
+            logger.info(
+                "⚠️ Embedding skipped for %s | reason=%s",
+                document_id,
+                "no_embedding_generator" if not embedding_generator else "no_chunks",
             )
             await broadcast(
                 document_id,
@@ -162,17 +208,34 @@ async def process_document_background(
             doc = result.scalar_one_or_none()
 
             if doc:
-                # Create Chunk records
-                for i, (chunk_obj, embedding) in enumerate(zip(chunks, embeddings)):
-                    chunk_record = Chunk(
-                        id=str(uuid.uuid4()),
-                        document_id=document_id,
-                        chunk_index=i,
-                        text=chunk_obj.text,
-                        chunk_metadata=json.dumps(chunk_obj.metadata),
-                        embedding=embedding.tobytes(),  # Store as bytes
+                # Insert chunk rows in one executemany, skipping ORM state
+                chunk_rows = [
+                    {
+                        "id": chunk_id,
+                        "document_id": document_id,
+                        "chunk_index": i,
+                        "text": chunk_obj.text,
+                        "chunk_metadata": dump_metadata(chunk_obj.metadata),
+                        "content_hash": chunk_hash,
+                        "embedding_model": embedding_generator.model_name
+                        if embedding_generator
+                        else None,
+                        "embedding": embedding.tobytes(),  # Store as bytes
+                    }
+                    for i, (chunk_id, chunk_obj, embedding, chunk_hash) in enumerate(
+                        zip(
+                            new_chunk_ids(len(chunks)),
+                            chunks,
+                            embeddings,
+                            chunk_hashes,
+                        )
                     )
-                    session.add(chunk_record)
+                ]
+                if chunk_rows:
+                    await session.execute(insert(Chunk), chunk_rows)
+                await VectorStore(session).index_chunk_vectors(
+                    document_id, [row["id"] for row in chunk_rows], embeddings
+                )
 
                 # Update document status
                 doc.status = "ready"
@@ -181,8 +244,10 @@ async def process_document_background(
                 doc.content_hash = processed_doc.content_hash
 
                 await session.commit()
-                print(
-                    f"[DOC PIPELINE] 🎯 Persisted document {document_id} | status=ready chunks={len(chunks_text)}"
+                logger.info(
+                    "🎯 Persisted document %s | status=ready chunks=%d",
+                    document_id,
+                    len(chunks_text),
                 )
                 await broadcast(
                     document_id,
@@ -195,12 +260,12 @@ async def process_document_background(
                     },
                 )
             else:
-                print(
-                    f"[DOC PIPELINE] ❌ Document {document_id} not found in DB during processing"
+                logger.error(
+                    "❌ Document %s not found in DB during processing", document_id
                 )
 
     except Exception as e:
-        print(f"[DOC PIPELINE] ❌ Error processing document {document_id}: {str(e)}")
+        logger.error("❌ Error processing document %s: %s", document_id, e)
         async with async_session() as session:
             result = await session.execute(
                 select(Document).where(Document.id == document_id)
@@ -233,11 +298,13 @@ async def check_conversation_has_documents(
     Returns:
         True if conversation has at least one document with status "ready"
     """
-    result = await session.execute(
-        select(Document)
-        .where(Document.conversation_id == conversation_id)
-        .where(Document.status == "ready")
-        .limit(1)
+    # EXISTS stops at the first index hit without loading a Document row
+    return bool(
+        await session.scalar(
+            select(
+                exists()
+                .where(Document.conversation_id == conversation_id)
+                .where(Document.status == "ready")
+            )
+        )
     )
-    document = result.scalar_one_or_none()
-    return document is not None
@@ -1,26 +1,95 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
 import os
-from typing import Dict, List
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
 
 import torch
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextStreamer
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    PreTrainedModel,
+    PreTrainedTokenizerBase,
+    StoppingCriteria,
+    TextStreamer,
+)
 
 from ..db.models import Client, Message, ModelConfig
+from ..db.session import async_session
+
+logger = logging.getLogger(__name__)
 
 # Global constants
 MAX_TOTAL_TOKENS = 8192
 MAX_GENERATION_TOKENS = 2048
 MAX_PROMPT_TOKENS = MAX_TOTAL_TOKENS - MAX_GENERATION_TOKENS
 
-ConversationMessage = Dict[str, str]
+# Chat-template markers that end the assistant turn; generation halts on
+# them in-engine instead of running on to max_new_tokens.
+GENERATION_STOP_STRINGS = ["<|im_end|>", "<|im_start|>"]
+
+ConversationMessage = Dict[str, Any]
+
+# Hard-coded generation fallbacks (used when neither the client nor the model
+# config sets a value)
+DEFAULT_REPETITION_PENALTY = 1.1
+DEFAULT_MAX_NEW_TOKENS = 2048
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_TOP_P = 0.9
+DEFAULT_TOP_K = 50
+
+
+@dataclass(slots=True, frozen=True)
+class LoadedModel:
+    """A loaded generator with the device/dtype it actually ended up on."""
+
+    model: PreTrainedModel
+    tokenizer: PreTrainedTokenizerBase
+    device: torch.device
+    dtype: torch.dtype
+
 
 # Global model cache
-model_cache = {}
+model_cache: Dict[str, LoadedModel] = {}
 
+# Per-model locks serializing cold loads of the same model
+_model_load_locks: Dict[str, threading.Lock] = {}
+_model_load_locks_lock = threading.Lock()
 
+# Per-model semaphores bounding concurrent model.generate calls
+_generation_slots: Dict[str, asyncio.Semaphore] = {}
+
+# Conservative bounds for the truncate_history fast path: tokens per char of
+# a formatted segment, and the chars the Qwen tags add around role/content
+MAX_TOKENS_PER_CHAR = 4
+SEGMENT_TAG_CHARS = len("<|im_start|>\n<|im_end|>")
+
+# LRU of message-segment token ids keyed by (tokenizer, role, content),
+# stored as compact int arrays
+SEGMENT_TOKEN_CACHE_SIZE = 4096
+_segment_token_ids: "OrderedDict[tuple, array]" = OrderedDict()
+_segment_token_ids_lock = threading.Lock()
+
+# Assistant-turn openers that end every prompt
+THINK_PREFIX = "<|im_start|>assistant\n<think>\n"
+NO_THINK_PREFIX = "<|im_start|>assistant\n</think>\n"
+
+
+@functools.lru_cache(maxsize=1)
 def get_preferred_device() -> torch.device:
-    """Pick the best available torch device (cuda > mps > cpu)."""
+    """Pick the best available torch device (cuda > mps > cpu).
+
+    Probed once per process; use get_preferred_device.cache_clear() to
+    re-probe (e.g. in tests that fake device availability).
+    """
     if torch.cuda.is_available():
         return torch.device("cuda")
 
@@ -31,6 +100,129 @@ def get_preferred_device() -> torch.device:
     return torch.device("cpu")
 
 
+def cuda_has_native_bf16(device: torch.device) -> bool:
+    """Whether the GPU runs bf16 matmuls natively (compute capability 8.0+).
+
+    torch.cuda.is_bf16_supported() also reports True on older GPUs that
+    only emulate bf16, far slower than their fp16 tensor cores.
+    """
+    major, _ = torch.cuda.get_device_capability(device)
+    return major >= 8
+
+
+def mps_supports_bf16() -> bool:
+    """Whether this PyTorch/macOS build can allocate bf16 tensors on MPS."""
+    try:
+        torch.ones(1, dtype=torch.bfloat16, device="mps")
+    except (RuntimeError, TypeError) as err:
+        logger.warning("⚠️  MPS_BF16 ignored, bf16 is not supported on MPS: %s", err)
+        return False
+    return True
+
+
+def get_quantization_mode() -> str | None:
+    """Read BAGUETTOTRON_QUANT as "int8" or "int4" ("nf4" is an alias).
+
+    Returns None (full precision) when unset or unrecognized.
+    """
+    mode = os.getenv("BAGUETTOTRON_QUANT", "").strip().lower()
+    if mode in ("", "0", "none", "off", "false"):
+        return None
+    if mode == "nf4":
+        return "int4"
+    if mode not in ("int8", "int4"):
+        logger.warning(
+            "⚠️  Unknown BAGUETTOTRON_QUANT=%r, loading full-precision weights", mode
+        )
+        return None
+    return mode
+
+
+def get_quantization_config(device: torch.device, mode: str | None):
+    """Build a bitsandbytes quantization config for a CUDA load.
+
+    Returns None (full-precision load) for other devices, which are
+    quantized after loading instead (see quantize_cpu_model), or when
+    bitsandbytes is unavailable.
+    """
+    if mode is None or device.type != "cuda":
+        return None
+    try:
+        import bitsandbytes  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "⚠️  bitsandbytes is not installed, loading full-precision weights"
+        )
+        return None
+
+    from transformers import BitsAndBytesConfig
+
+    if mode == "int8":
+        return BitsAndBytesConfig(load_in_8bit=True)
+    return BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=(
+            torch.bfloat16 if cuda_has_native_bf16(device) else torch.float16
+        ),
+    )
+
+
+def quantize_cpu_model(model: PreTrainedModel, mode: str) -> bool:
+    """Quantize a loaded fp32 CPU model's Linear weights in place.
+
+    int8 uses PyTorch dynamic quantization, which needs no extra package.
+    int4 needs optimum-quanto (weight-only qint4). Returns whether the model
+    was quantized.
+    """
+    if mode == "int8":
+        torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        return True
+    try:
+        from optimum.quanto import freeze, qint4, quantize
+    except ImportError:
+        logger.warning(
+            "⚠️  BAGUETTOTRON_QUANT=int4 on CPU needs optimum-quanto, "
+            "keeping full-precision weights"
+        )
+        return False
+    quantize(model, weights=qint4)
+    freeze(model)
+    return True
+
+
+def compile_for_static_cache(model: PreTrainedModel) -> None:
+    """Switch generation to a static KV cache and compile the forward pass.
+
+    With fixed-shape cache tensors, "reduce-overhead" captures the decode
+    step in CUDA graphs, removing most per-token Python/dispatch overhead.
+    The first generations pay for compilation (and recompile for new
+    prompt shapes), so this is opt-in.
+    """
+    model.generation_config.cache_implementation = "static"
+    model.forward = torch.compile(
+        model.forward, mode="reduce-overhead", fullgraph=False
+    )
+    logger.info("⚡ Compiled forward pass with a static KV cache")
+
+
+def get_attention_implementation(device: torch.device) -> str | None:
+    """Pick a fused attention kernel for CUDA loads.
+
+    flash_attention_2 when the flash-attn package is installed, otherwise
+    PyTorch SDPA. Other devices keep the transformers default.
+    """
+    if device.type != "cuda":
+        return None
+    try:
+        import flash_attn  # noqa: F401
+    except ImportError:
+        return "sdpa"
+    return "flash_attention_2"
+
+
 async def get_or_create_client(session: AsyncSession, fingerprint: str) -> Client:
     result = await session.execute(
         select(Client).where(Client.fingerprint == fingerprint)
@@ -43,25 +235,83 @@ async def get_or_create_client(session: AsyncSession, fingerprint: str) -> Clien
     return client
 
 
-async def fetch_messages(session: AsyncSession, conversation_id: str) -> List[Message]:
+def tokenizer_identity(tokenizer) -> str | None:
+    """Name stored next to persisted token counts to tell tokenizers apart."""
+    return getattr(tokenizer, "name_or_path", None) or None
+
+
+async def fetch_message_payloads(
+    session: AsyncSession, conversation_id: str, tokenizer=None
+) -> List[ConversationMessage]:
+    """Return the conversation's messages oldest-first as role/content dicts.
+
+    Only the columns needed for history building are selected, so stored
+    thinking text is never read and no ORM objects are built. Every write
+    deletes the messages that fell out of the token window, so this reads
+    no more rows than the prompt keeps (plus the one pushed out next).
+    Each dict also carries the message's stored token_count when it was
+    counted with the given tokenizer, and None otherwise.
+    """
+    tokenizer_name = tokenizer_identity(tokenizer)
     result = await session.execute(
-        select(Message)
+        select(
+            Message.role,
+            Message.content,
+            Message.token_count,
+            Message.token_count_tokenizer,
+        )
         .where(Message.conversation_id == conversation_id)
         .order_by(Message.created_at, Message.id)
     )
-    return list(result.scalars().all())
+    return [
+        {
+            "role": row.role,
+            "content": row.content,
+            "token_count": (
+                row.token_count
+                if tokenizer_name is not None
+                and row.token_count_tokenizer == tokenizer_name
+                else None
+            ),
+        }
+        for row in result
+    ]
 
 
 async def delete_oldest_messages(
     session: AsyncSession,
-    ordered_messages: List[Message],
+    conversation_id: str,
     drop_count: int,
 ) -> None:
-    if drop_count <= 0 or not ordered_messages:
+    """Delete a conversation's drop_count oldest messages in one statement.
+
+    The rows are picked by a LIMIT subquery on the (conversation_id,
+    created_at, id) index, so no id list is bound as parameters.
+    """
+    if drop_count <= 0:
         return
-    ids_to_drop = [message.id for message in ordered_messages[:drop_count]]
-    if ids_to_drop:
-        await session.execute(delete(Message).where(Message.id.in_(ids_to_drop)))
+    oldest = (
+        select(Message.id)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at, Message.id)
+        .limit(drop_count)
+    )
+    await session.execute(delete(Message).where(Message.id.in_(oldest)))
+
+
+async def _replace_window_and_insert(
+    session: AsyncSession,
+    drop_count: int,
+    **message_values,
+) -> None:
+    """Drop messages that fell out of the window and insert the new one.
+
+    Both are plain Core statements sent back-to-back in one transaction, so
+    there is no ORM flush or RETURNING fetch for the inserted row.
+    """
+    await delete_oldest_messages(session, message_values["conversation_id"], drop_count)
+    await session.execute(insert(Message).values(**message_values))
+    await session.commit()
 
 
 async def persist_user_turn(
@@ -70,26 +320,67 @@ async def persist_user_turn(
     content: str,
     tokenizer,
     system_prompt_tokens: int = 0,
-) -> List[ConversationMessage]:
-    stored_messages = await fetch_messages(session, conversation_id)
+) -> Tuple[List[ConversationMessage], asyncio.Task]:
+    """Build the truncated history for a new user message and store it.
 
-    # Log conversation history
-    print(f"\n📚 Building conversation history ({len(stored_messages)} messages in DB)")
+    Only the history read happens inline; the write (dropping messages that
+    fell out of the window and inserting the new one) runs as a task on its
+    own session so it stays off the time-to-first-token path. Await the
+    returned task before persisting the assistant reply.
+    """
+    stored_messages = await fetch_message_payloads(session, conversation_id, tokenizer)
 
-    payload = [
-        {"role": message.role, "content": message.content}
-        for message in stored_messages
-    ]
+    # Log conversation history
+    logger.debug(
+        "📚 Building conversation history (%d messages in DB)", len(stored_messages)
+    )
 
+    payload = [*stored_messages]
     payload.append({"role": "user", "content": content})
-    truncated_history = truncate_history(
-        payload, tokenizer, MAX_PROMPT_TOKENS, system_prompt_tokens
+    # Tokenizing a long history takes long enough to stall other sockets;
+    # fast tokenizers release the GIL, so a worker thread runs it in parallel
+    truncated_history = await asyncio.to_thread(
+        truncate_history, payload, tokenizer, MAX_PROMPT_TOKENS, system_prompt_tokens
     )
     drop_count = len(payload) - len(truncated_history)
-    await delete_oldest_messages(session, stored_messages, drop_count)
-    session.add(Message(conversation_id=conversation_id, role="user", content=content))
-    await session.commit()
-    return truncated_history
+    write_task = asyncio.create_task(
+        _write_user_turn(conversation_id, content, tokenizer, drop_count)
+    )
+    return truncated_history, write_task
+
+
+async def _write_user_turn(
+    conversation_id: str,
+    content: str,
+    tokenizer,
+    drop_count: int,
+) -> None:
+    token_values = await asyncio.to_thread(
+        _token_count_values, tokenizer, "user", content
+    )
+    async with async_session() as session:
+        await _replace_window_and_insert(
+            session,
+            drop_count,
+            conversation_id=conversation_id,
+            role="user",
+            content=content,
+            **token_values,
+        )
+
+
+def _token_count_values(tokenizer, role: str, content: str) -> Dict[str, Any]:
+    """Column values persisting a new message's token count.
+
+    Counted once at insert time, so later turns read the count back with the
+    history instead of re-tokenizing the message after a restart.
+    """
+    return {
+        "token_count": count_tokens_for_message(
+            tokenizer, {"role": role, "content": content}
+        ),
+        "token_count_tokenizer": tokenizer_identity(tokenizer),
+    }
 
 
 async def persist_assistant_turn(
@@ -100,133 +391,394 @@ async def persist_assistant_turn(
     thinking: str | None = None,
     system_prompt_tokens: int = 0,
 ) -> None:
-    stored_messages = await fetch_messages(session, conversation_id)
-
-    payload = [
-        {"role": message.role, "content": message.content}
-        for message in stored_messages
-    ]
+    stored_messages = await fetch_message_payloads(session, conversation_id, tokenizer)
 
+    payload = [*stored_messages]
     payload.append({"role": "assistant", "content": content})
-    truncated_history = truncate_history(
-        payload, tokenizer, MAX_PROMPT_TOKENS, system_prompt_tokens
+    # Off the event loop, as in persist_user_turn
+    truncated_history = await asyncio.to_thread(
+        truncate_history, payload, tokenizer, MAX_PROMPT_TOKENS, system_prompt_tokens
     )
     drop_count = len(payload) - len(truncated_history)
-    await delete_oldest_messages(session, stored_messages, drop_count)
-    session.add(
-        Message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=content,
-            thinking=thinking,
-        )
+    token_values = await asyncio.to_thread(
+        _token_count_values, tokenizer, "assistant", content
     )
-    await session.commit()
+    await _replace_window_and_insert(
+        session,
+        drop_count,
+        conversation_id=conversation_id,
+        role="assistant",
+        content=content,
+        thinking=thinking,
+        **token_values,
+    )
+
+
+# Decoded characters the streamer buffers before the generation thread waits
+# for the consumer, and how long it waits before giving the stream up
+STREAM_BUFFER_MAX_CHARS = 16384
+STREAM_BACKPRESSURE_TIMEOUT = 30.0
+
+# Tags the stream parser reacts to; see find_next_tag in main
+STREAM_TAGS = (
+    "<think>",
+    "</think>",
+    "<thinking>",
+    "</thinking>",
+    "<|im_end|>",
+    "<|im_start|>",
+)
+
+
+@functools.lru_cache(maxsize=16)
+def _single_token_tags(tokenizer, tags: Tuple[str, ...]) -> Dict[int, str]:
+    """Map token id -> tag for the tags the tokenizer encodes as one token.
+
+    Cached per tokenizer and shared by every streamer; treat as read-only.
+    """
+    tag_ids = {}
+    for tag in tags:
+        ids = tokenizer.encode(tag, add_special_tokens=False)
+        if len(ids) == 1:
+            tag_ids[ids[0]] = tag
+    return tag_ids
 
 
 class AsyncQueueTextStreamer(TextStreamer):
-    """Text streamer that pushes decoded chunks into an asyncio.Queue."""
+    """Text streamer that hands decoded text to the event loop.
 
-    def __init__(
-        self, tokenizer, loop, async_queue, skip_prompt=False, **decode_kwargs
-    ):
+    The generation thread appends decoded pieces to a buffer and the consumer
+    drains it with ``async for``. An ``asyncio.Event`` signals new data; only
+    one ``call_soon_threadsafe`` wakeup is pending at a time, and each wakeup
+    yields everything buffered since the last one as a single string, so a
+    burst of tokens costs one loop wakeup and one parse/send downstream.
+
+    The buffer is bounded: once STREAM_BUFFER_MAX_CHARS are waiting, the
+    generation thread blocks until the consumer drains them, and closes the
+    stream (stopping generation) if that takes STREAM_BACKPRESSURE_TIMEOUT.
+    """
+
+    def __init__(self, tokenizer, loop, skip_prompt=False, **decode_kwargs):
         super().__init__(tokenizer, skip_prompt, **decode_kwargs)
         self.loop = loop
-        self.queue = async_queue
-        self.stop_signal = object()
         self._closed = False
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._pending_lock = threading.Lock()
+        self._drained = threading.Condition(self._pending_lock)
+        self._ready = asyncio.Event()
+        self._wakeup_scheduled = False
+        # Parser tags that are a single token id map straight to their text
+        self._tag_token_ids: Dict[int, str] = (
+            {}
+            if decode_kwargs.get("skip_special_tokens")
+            else _single_token_tags(tokenizer, STREAM_TAGS)
+        )
+
+    def put(self, value):
+        """Pass single-token tags through as their own text, without decoding.
+
+        The cached text before the tag is flushed first so the tag is never
+        re-decoded as part of the token cache.
+        """
+        if self._tag_token_ids and not (
+            self.skip_prompt and self.next_tokens_are_prompt
+        ):
+            if value.numel() == 1:
+                tag = self._tag_token_ids.get(int(value.reshape(-1)[0]))
+                if tag is not None:
+                    self._flush_token_cache()
+                    self.on_finalized_text(tag)
+                    return
+        super().put(value)
+
+    def _flush_token_cache(self) -> None:
+        if self.token_cache:
+            text = self.tokenizer.decode(self.token_cache, **self.decode_kwargs)
+            printable_text = text[self.print_len :]
+            self.token_cache = []
+            self.print_len = 0
+            self.on_finalized_text(printable_text)
 
     def on_finalized_text(self, text: str, stream_end: bool = False):
-        self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        if text:
+            self._push(text)
         if stream_end:
             self.close()
 
     def close(self):
-        if not self._closed:
+        with self._pending_lock:
+            if self._closed:
+                return
             self._closed = True
-            self.loop.call_soon_threadsafe(self.queue.put_nowait, self.stop_signal)
+            self._drained.notify_all()
+        self._wake()
+
+    def _push(self, text: str) -> None:
+        with self._pending_lock:
+            if self._pending_chars >= STREAM_BUFFER_MAX_CHARS and not self._closed:
+                if not self._drained.wait_for(
+                    lambda: (
+                        self._pending_chars < STREAM_BUFFER_MAX_CHARS or self._closed
+                    ),
+                    timeout=STREAM_BACKPRESSURE_TIMEOUT,
+                ):
+                    logger.warning(
+                        "⚠️  Stream consumer stalled for %.0fs, stopping generation",
+                        STREAM_BACKPRESSURE_TIMEOUT,
+                    )
+                    self._closed = True
+            if self._closed:
+                return
+            self._pending.append(text)
+            self._pending_chars += len(text)
+        self._wake()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _wake(self) -> None:
+        with self._pending_lock:
+            if self._wakeup_scheduled:
+                return
+            self._wakeup_scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The event loop is closed (server shutting down): nobody will
+            # drain the buffer, so drop it and let generation stop
+            with self._pending_lock:
+                self._closed = True
+                self._pending.clear()
+                self._pending_chars = 0
+                self._drained.notify_all()
+
+    async def __aiter__(self):
+        """Yield buffered text, coalesced per wakeup, until the stream closes."""
+        while True:
+            await self._ready.wait()
+            with self._pending_lock:
+                text = "".join(self._pending)
+                self._pending.clear()
+                self._pending_chars = 0
+                self._drained.notify_all()
+                closed = self._closed
+                self._ready.clear()
+                self._wakeup_scheduled = False
+            if text:
+                yield text
+            if closed:
+                return
+
+
+class StopWhenStreamerClosed(StoppingCriteria):
+    """Stop generate() once its streamer has been closed.
+
+    Cancelling the task that awaits generate() does not stop the worker
+    thread running it; without this, a disconnected client's generation
+    runs on to max_new_tokens, holding its KV cache and the device.
+    """
 
+    def __init__(self, streamer: AsyncQueueTextStreamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],),
+            self.streamer.closed,
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
 
-def load_model(model_name: str = "PleIAs/Baguettotron"):
-    """Load and cache the model"""
-    if model_name not in model_cache:
-        print(f"\n{'=' * 60}")
-        print(f"🔄 Loading model: {model_name}")
-        print(f"{'=' * 60}")
 
-        device = get_preferred_device()
+def is_model_loaded(model_name: str) -> bool:
+    """Return True if load_model would be served from the in-process cache."""
+    return model_name in model_cache
 
-        # Choose dtype: CUDA -> fp16, MPS -> fp32 by default (fp16 opt-in), CPU -> fp32
-        if device.type == "cuda":
+
+def get_generation_slot(model_name: str) -> asyncio.Semaphore | None:
+    """Return the semaphore that admits generate() calls for a model.
+
+    Returns None (no limit) unless GENERATION_CONCURRENCY is set, in which
+    case requests beyond that many queue here instead of contending for the
+    same device.
+    """
+    limit = os.getenv("GENERATION_CONCURRENCY")
+    if not limit:
+        return None
+    slot = _generation_slots.get(model_name)
+    if slot is None:
+        slot = asyncio.Semaphore(max(1, int(limit)))
+        _generation_slots[model_name] = slot
+    return slot
+
+
+def load_model(model_name: str = "PleIAs/Baguettotron") -> LoadedModel:
+    """Load and cache the model.
+
+    Callers run this in worker threads, so a per-model lock makes concurrent
+    requests for a cold model wait for one load instead of each reading the
+    weights into memory.
+    """
+    loaded = model_cache.get(model_name)
+    if loaded is not None:
+        logger.debug("♻️  Using cached model: %s", model_name)
+        return loaded
+
+    with _model_load_locks_lock:
+        load_lock = _model_load_locks.setdefault(model_name, threading.Lock())
+    with load_lock:
+        loaded = model_cache.get(model_name)
+        if loaded is None:
+            loaded = _load_model_uncached(model_name)
+            model_cache[model_name] = loaded
+    return loaded
+
+
+def _load_model_uncached(model_name: str) -> LoadedModel:
+    logger.info("🔄 Loading model: %s", model_name)
+
+    device = get_preferred_device()
+
+    # Choose dtype: CUDA -> bf16 on Ampere+ (fp16 before), MPS -> fp32 by
+    # default (bf16/fp16 opt-in), CPU -> fp32 by default (bf16 opt-in)
+    if device.type == "cuda":
+        dtype = torch.bfloat16 if cuda_has_native_bf16(device) else torch.float16
+    elif device.type == "mps":
+        mps_bf16 = os.getenv("MPS_BF16", "0").lower() in ("1", "true", "yes", "y")
+        mps_fp16 = os.getenv("MPS_FP16", "0").lower() in ("1", "true", "yes", "y")
+        if mps_bf16 and mps_supports_bf16():
+            dtype = torch.bfloat16
+        elif mps_fp16:
             dtype = torch.float16
-        elif device.type == "mps":
-            mps_fp16 = os.getenv("MPS_FP16", "0").lower() in ("1", "true", "yes", "y")
-            dtype = torch.float16 if mps_fp16 else torch.float32
         else:
             dtype = torch.float32
+    else:
+        cpu_bf16 = os.getenv("CPU_BF16", "0").lower() in ("1", "true", "yes", "y")
+        dtype = torch.bfloat16 if cpu_bf16 else torch.float32
+
+    quant_mode = get_quantization_mode()
+    if quant_mode is not None and device.type == "mps":
+        logger.warning(
+            "⚠️  BAGUETTOTRON_QUANT=%s is not supported on MPS, "
+            "loading full-precision weights",
+            quant_mode,
+        )
+        quant_mode = None
+    if quant_mode is not None and device.type == "cpu":
+        # CPU quantization works from fp32 weights
+        dtype = torch.float32
+
+    logger.info("🖥️  Using device: %s (dtype=%s)", device, dtype)
+    if device.type == "cpu":
+        logger.info("⚙️  No GPU/MPS detected, running on CPU")
+    # The Rust tokenizer; the Python one runs BPE merges in a Python loop
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    if not tokenizer.is_fast:
+        logger.warning(
+            "⚠️  No fast tokenizer for %s, tokenization will be much slower",
+            model_name,
+        )
+    # Resolve the stream tag and prompt glue ids now rather than on the
+    # first chat request
+    _single_token_tags(tokenizer, STREAM_TAGS)
+    _get_prompt_layout(tokenizer)
+    quantization_config = get_quantization_config(device, quant_mode)
+    if quantization_config is not None:
+        logger.info("🗜️  Quantizing weights: %s", quant_mode)
+    attn_implementation = get_attention_implementation(device)
+    if attn_implementation is not None:
+        logger.info("⚡ Attention implementation: %s", attn_implementation)
+
+    def _load(
+        target_device: torch.device,
+        target_dtype: torch.dtype,
+        use_device_map: bool = True,
+    ):
+        # Use device_map to place directly on accelerator; optional
+        device_map = (
+            {"": target_device}
+            if (use_device_map and target_device.type != "cpu")
+            else None
+        )
+        # bitsandbytes needs device_map placement on the accelerator
+        quant_kwargs = (
+            {"quantization_config": quantization_config}
+            if quantization_config is not None and device_map is not None
+            else {}
+        )
+        attn_kwargs = (
+            {"attn_implementation": attn_implementation}
+            if attn_implementation is not None and target_device.type == "cuda"
+            else {}
+        )
+        return AutoModelForCausalLM.from_pretrained(
+            model_name,
+            dtype=target_dtype,  # new HF arg
+            device_map=device_map,
+            # Stream weights straight to the accelerator; the plain CPU
+            # path avoids meta tensors
+            low_cpu_mem_usage=device_map is not None,
+            **quant_kwargs,
+            **attn_kwargs,
+        )
 
-        print(f"🖥️  Using device: {device} (dtype={dtype})")
+    try:
+        model = _load(device, dtype, use_device_map=True)
+        if device.type == "cpu":
+            model.to(device)
+        load_device, load_dtype = device, dtype
+    except RuntimeError as err:
+        logger.warning("⚠️  Failed to load model on %s: %s", device, err)
         if device.type == "mps":
-            print("🍎 Detected Apple Silicon (MPS backend)")
-        elif device.type == "cpu":
-            print("⚙️  No GPU/MPS detected, running on CPU")
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-
-        def _load(
-            target_device: torch.device,
-            target_dtype: torch.dtype,
-            use_device_map: bool = True,
-        ):
-            # Use device_map to place directly on accelerator; optional
-            device_map = (
-                {"": target_device}
-                if (use_device_map and target_device.type != "cpu")
-                else None
-            )
-            return AutoModelForCausalLM.from_pretrained(
-                model_name,
-                dtype=target_dtype,  # new HF arg
-                device_map=device_map,
-                low_cpu_mem_usage=False,  # avoid meta tensors
-            )
-
-        try:
-            model = _load(device, dtype, use_device_map=True)
-            if device.type == "cpu":
+            # Retry without device_map (load on CPU then move) to avoid meta issues
+            try:
+                logger.warning("↩️  Retrying MPS load without device_map...")
+                model = _load(device, dtype, use_device_map=False)
                 model.to(device)
-            load_device, load_dtype = device, dtype
-        except RuntimeError as err:
-            print(f"⚠️  Failed to load model on {device}: {err}")
-            if device.type == "mps":
-                # Retry without device_map (load on CPU then move) to avoid meta issues
-                try:
-                    print("↩️  Retrying MPS load without device_map...")
-                    model = _load(device, dtype, use_device_map=False)
-                    model.to(device)
-                    load_device, load_dtype = device, dtype
-                except RuntimeError as err2:
-                    print(f"⚠️  MPS retry failed: {err2}")
-                    print("↩️  Falling back to CPU with float32")
-                    load_device = torch.device("cpu")
-                    load_dtype = torch.float32
-                    model = _load(load_device, load_dtype, use_device_map=False)
-            else:
-                print("↩️  Falling back to CPU with float32")
+                load_device, load_dtype = device, dtype
+            except RuntimeError as err2:
+                logger.warning("⚠️  MPS retry failed: %s", err2)
+                logger.warning("↩️  Falling back to CPU with float32")
                 load_device = torch.device("cpu")
                 load_dtype = torch.float32
                 model = _load(load_device, load_dtype, use_device_map=False)
+        else:
+            logger.warning("↩️  Falling back to CPU with float32")
+            load_device = torch.device("cpu")
+            load_dtype = torch.float32
+            model = _load(load_device, load_dtype, use_device_map=False)
+
+    # bitsandbytes only quantizes at load time on CUDA; CPU loads
+    # (including fallbacks) are quantized once the fp32 weights are in
+    if quant_mode is not None and load_device.type == "cpu":
+        if quantize_cpu_model(model, quant_mode):
+            logger.info("🗜️  Quantized CPU weights: %s", quant_mode)
+
+    # generate() only disables grad; inference mode also skips the version
+    # counters and view tracking on every tensor of the decode loop. The
+    # mode is thread-local, so it is bound to generate itself, which runs
+    # in a worker thread.
+    model.eval()
+    model.requires_grad_(False)
+    model.generate = torch.inference_mode()(model.generate)
+
+    if (
+        load_device.type == "cuda"
+        and quantization_config is None
+        and os.getenv("TORCH_COMPILE", "0").lower() in ("1", "true", "yes", "y")
+    ):
+        compile_for_static_cache(model)
 
-        model_cache[model_name] = {
-            "model": model,
-            "tokenizer": tokenizer,
-            "device": load_device,
-            "dtype": load_dtype,
-        }
-        print(f"✅ Model {model_name} loaded successfully!")
-        print(f"{'=' * 60}\n")
-    else:
-        print(f"♻️  Using cached model: {model_name}")
-    return model_cache[model_name]
+    loaded = LoadedModel(
+        model=model,
+        tokenizer=tokenizer,
+        device=load_device,
+        dtype=load_dtype,
+    )
+    logger.info("✅ Model %s loaded successfully!", model_name)
+    return loaded
 
 
 def get_generation_params(client: Client, model_config: ModelConfig | None) -> dict:
@@ -243,31 +795,38 @@ def get_generation_params(client: Client, model_config: ModelConfig | None) -> d
     # Get do_sample (default to False for deterministic)
     do_sample = client.do_sample if client.do_sample is not None else False
 
-    # Start with base parameters
+    # Always include repetition_penalty and max_new_tokens
     params = {
         "do_sample": do_sample,
+        "repetition_penalty": (
+            client.repetition_penalty
+            if client.repetition_penalty is not None
+            else DEFAULT_REPETITION_PENALTY
+        ),
+        "max_new_tokens": (
+            client.max_tokens
+            if client.max_tokens is not None
+            else (
+                model_config.default_max_tokens
+                if model_config
+                else DEFAULT_MAX_NEW_TOKENS
+            )
+        ),
     }
 
-    # Always include repetition_penalty and max_new_tokens
-    params["repetition_penalty"] = (
-        client.repetition_penalty if client.repetition_penalty is not None else 1.1
-    )
-
-    params["max_new_tokens"] = (
-        client.max_tokens
-        if client.max_tokens is not None
-        else (model_config.default_max_tokens if model_config else 2048)
-    )
-
     # Only include sampling params if do_sample is True
     if do_sample:
         params["temperature"] = (
             client.temperature
             if client.temperature is not None
-            else (model_config.default_temperature if model_config else 0.7)
+            else (
+                model_config.default_temperature
+                if model_config
+                else DEFAULT_TEMPERATURE
+            )
         )
-        params["top_p"] = client.top_p if client.top_p is not None else 0.9
-        params["top_k"] = client.top_k if client.top_k is not None else 50
+        params["top_p"] = client.top_p if client.top_p is not None else DEFAULT_TOP_P
+        params["top_k"] = client.top_k if client.top_k is not None else DEFAULT_TOP_K
 
     return params
 
@@ -276,17 +835,133 @@ def _format_message_segment(message: ConversationMessage) -> str:
     return f"<|im_start|>{message['role']}\n{message['content']}<|im_end|>"
 
 
+def encode_without_special_tokens(tokenizer, texts: List[str]) -> List[List[int]]:
+    """Token ids for each text, without BOS/EOS.
+
+    Fast tokenizers are called through their Rust backend directly, which
+    skips building a BatchEncoding (attention masks and all) that is only
+    thrown away. The whole list goes through one batched call, using
+    encode_batch_fast (tokenizers >= 0.20) to also skip the character offsets
+    nothing here reads. Falls back to the regular call for slow tokenizers
+    or when the backend has padding/truncation configured.
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None and backend.padding is None and backend.truncation is None:
+        encode_batch = getattr(backend, "encode_batch_fast", backend.encode_batch)
+        return [
+            encoding.ids for encoding in encode_batch(texts, add_special_tokens=False)
+        ]
+    pool = None if tokenizer.is_fast else _get_tokenizer_pool(tokenizer)
+    if pool is not None:
+        return pool.submit(_encode_in_worker, texts).result()
+    return tokenizer(texts, add_special_tokens=False).input_ids
+
+
+# Tokenizer worker processes, one pool per slow tokenizer. Fast tokenizers
+# release the GIL and already run in parallel on threads; slow (pure
+# Python) ones hold it, so TOKENIZER_POOL_SIZE > 0 moves them out of process.
+_tokenizer_pools: Dict[str, ProcessPoolExecutor] = {}
+_tokenizer_pools_lock = threading.Lock()
+_worker_tokenizer = None
+
+
+def _init_tokenizer_worker(name_or_path: str) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = AutoTokenizer.from_pretrained(name_or_path)
+
+
+def _encode_in_worker(texts: List[str]) -> List[List[int]]:
+    return _worker_tokenizer(texts, add_special_tokens=False).input_ids
+
+
+def _get_tokenizer_pool(tokenizer) -> ProcessPoolExecutor | None:
+    """Worker pool encoding with a copy of a slow tokenizer, if enabled."""
+    pool_size = int(os.getenv("TOKENIZER_POOL_SIZE", "0"))
+    name = tokenizer_identity(tokenizer)
+    if pool_size <= 0 or name is None:
+        return None
+    with _tokenizer_pools_lock:
+        pool = _tokenizer_pools.get(name)
+        if pool is None:
+            # Workers load their tokenizer once; spawn keeps them from
+            # inheriting the parent's model weights and CUDA state
+            pool = ProcessPoolExecutor(
+                max_workers=pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_tokenizer_worker,
+                initargs=(name,),
+            )
+            _tokenizer_pools[name] = pool
+    return pool
+
+
+def get_segment_token_ids(
+    tokenizer, messages: List[ConversationMessage]
+) -> List[array]:
+    """Token ids of Qwen-format message segments, memoized per message.
+
+    History is re-encoded on every turn, so only messages that are new since
+    the previous turn reach the tokenizer, and those are encoded together in
+    a single batched call.
+    """
+    keys = [(tokenizer, m["role"], m["content"]) for m in messages]
+    with _segment_token_ids_lock:
+        segment_ids = [_segment_token_ids.get(key) for key in keys]
+        for key, ids in zip(keys, segment_ids):
+            if ids is not None:
+                _segment_token_ids.move_to_end(key)
+
+    missing = [i for i, ids in enumerate(segment_ids) if ids is None]
+    if missing:
+        encoded = encode_without_special_tokens(
+            tokenizer, [_format_message_segment(messages[i]) for i in missing]
+        )
+        with _segment_token_ids_lock:
+            for i, ids in zip(missing, encoded):
+                segment_ids[i] = array("i", ids)
+                _segment_token_ids[keys[i]] = segment_ids[i]
+            while len(_segment_token_ids) > SEGMENT_TOKEN_CACHE_SIZE:
+                _segment_token_ids.popitem(last=False)
+    return segment_ids
+
+
+def count_tokens_for_messages(
+    tokenizer, messages: List[ConversationMessage]
+) -> List[int]:
+    """Token counts of Qwen-format message segments.
+
+    A count persisted with the message (its "token_count") is used as is;
+    the rest come from the memoized segment ids.
+    """
+    counts: List[int | None] = [m.get("token_count") for m in messages]
+    uncounted = [i for i, count in enumerate(counts) if count is None]
+    if uncounted:
+        segment_ids = get_segment_token_ids(tokenizer, [messages[i] for i in uncounted])
+        for i, ids in zip(uncounted, segment_ids):
+            counts[i] = len(ids)
+    return counts
+
+
 def count_tokens_for_message(tokenizer, message: ConversationMessage) -> int:
-    segment = _format_message_segment(message)
-    return len(tokenizer(segment, add_special_tokens=False).input_ids)
+    return count_tokens_for_messages(tokenizer, [message])[0]
+
+
+@functools.lru_cache(maxsize=256)
+def get_system_prompt_token_ids(tokenizer, system_prompt: str) -> Tuple[int, ...]:
+    """Token ids of the Qwen-format system segment, cached per tokenizer/prompt.
+
+    System prompts are fixed per client, so every turn after the first reuses
+    the cached ids instead of re-tokenizing the same prefix.
+    """
+    segment = f"<|im_start|>system\n{system_prompt}<|im_end|>"
+    return tuple(encode_without_special_tokens(tokenizer, [segment])[0])
 
 
 def count_tokens_for_system_prompt(tokenizer, system_prompt: str | None) -> int:
     """Count tokens for system prompt in Qwen format."""
     if not system_prompt:
         return 0
-    segment = f"<|im_start|>system\n{system_prompt}<|im_end|>"
-    return len(tokenizer(segment, add_special_tokens=False).input_ids)
+    return len(get_system_prompt_token_ids(tokenizer, system_prompt))
 
 
 def truncate_history(
@@ -302,147 +977,214 @@ def truncate_history(
     # Reserve space for system prompt
     available_tokens = max_tokens - system_prompt_tokens
 
-    total_tokens = 0
-    truncated: List[ConversationMessage] = []
-
-    for message in reversed(messages):
-        message_tokens = count_tokens_for_message(tokenizer, message)
-        # Always keep the latest message, even if it alone exceeds the limit
-        if truncated and total_tokens + message_tokens > available_tokens:
-            break
-        truncated.append(message)
-        total_tokens += message_tokens
-    truncated.reverse()
-
-    kept = len(truncated)
-    dropped = len(messages) - kept
-    if dropped > 0:
-        print(f"⚠️  Truncated chat history: kept {kept} messages, dropped {dropped}")
-    return truncated
-
-
-def format_prompt(
-    messages: List[ConversationMessage],
-    thinking_mode: bool = True,
-    system_prompt: str | None = None,
-):
-    """Format the sliding-window history in Qwen instruction style with optional system prompt."""
-    # TASK 2: Detailed logging inside format_prompt() function
-    print(f"\n{'=' * 80}")
-    print("🔍 TASK 2: format_prompt() FUNCTION EXECUTION")
-    print(f"{'=' * 80}")
-    print("📥 Input parameters:")
-    print(f"  - thinking_mode: {thinking_mode} (type: {type(thinking_mode).__name__})")
-    print(
-        f"  - system_prompt: {'Present' if system_prompt else 'None'} ({len(system_prompt) if system_prompt else 0} chars)"
+    # Fast path: a token never covers less than one UTF-8 byte and a char is
+    # at most 4 bytes, so 4 tokens/char bounds any segment from above. If even
+    # that bound fits, everything is kept without tokenizing.
+    upper_bound = MAX_TOKENS_PER_CHAR * sum(
+        len(m["role"]) + len(m["content"]) + SEGMENT_TAG_CHARS for m in messages
     )
-    print(f"  - messages count: {len(messages)}")
-
-    segments = []
-
-    # Prepend system message if provided
-    if system_prompt:
-        system_segment = f"<|im_start|>system\n{system_prompt}<|im_end|>"
-        segments.append(system_segment)
-        print("\n📋 System prompt segment added:")
-        print(f"  Length: {len(system_segment)} chars")
-        print(
-            f"  Preview: {system_segment[:100]}..."
-            if len(system_segment) > 100
-            else f"  Content: {system_segment}"
-        )
-
-    # Add conversation history
-    for message in messages:
-        formatted_msg = _format_message_segment(message)
-        segments.append(formatted_msg)
-
-    # Add assistant prefix
-    assistant_prefix = "<|im_start|>assistant\n"
-    assistant_prefix += "<think>\n" if thinking_mode else "</think>\n"
-    segments.append(assistant_prefix)
+    if upper_bound <= available_tokens:
+        return messages
 
-    prompt = "\n".join(segments)
+    message_token_counts = count_tokens_for_messages(tokenizer, messages)
 
-    print("\n📝 PROMPT SENT TO MODEL:")
-    print(f"{'─' * 80}")
-    print(prompt)
-    print(f"{'─' * 80}\n")
+    # Walk back from the newest message to the oldest one that still fits
+    # and keep that suffix as one slice. The latest message is always kept,
+    # even if it alone exceeds the limit.
+    start = len(messages) - 1
+    total_tokens = message_token_counts[start]
+    while start > 0:
+        total_tokens += message_token_counts[start - 1]
+        if total_tokens > available_tokens:
+            break
+        start -= 1
 
-    return prompt
+    if start > 0:
+        logger.info(
+            "⚠️  Truncated chat history: kept %d messages, dropped %d",
+            len(messages) - start,
+            start,
+        )
+    return messages[start:]
 
 
-def format_prompt_with_rag(
-    conversation_history: List[ConversationMessage],
+def _build_prompt(
+    messages: List[ConversationMessage],
     thinking_mode: bool,
     system_prompt: str | None,
-    formatted_sources: str,
-    current_user_message: str,
 ) -> str:
+    """Join system, history and assistant-prefix segments in one pass.
+
+    The Qwen tags are written directly rather than through
+    tokenizer.apply_chat_template: the Jinja template is rendered in Python
+    before tokenization (no fewer passes), and templates may inject their
+    own default system prompt or thinking prefix.
+    """
+    parts = [f"<|im_start|>system\n{system_prompt}<|im_end|>"] if system_prompt else []
+    parts.extend(map(_format_message_segment, messages))
+    parts.append(THINK_PREFIX if thinking_mode else NO_THINK_PREFIX)
+    return "\n".join(parts)
+
+
+@dataclass(slots=True, frozen=True)
+class _PromptLayout:
+    """Ids that glue cached segment ids into a full prompt for one tokenizer.
+
+    Attributes:
+        prefix: Special tokens the tokenizer adds before the text (e.g. BOS)
+        separator: Ids of the newline between segments
+        think: Ids of the assistant opener with thinking enabled
+        no_think: Ids of the assistant opener with thinking disabled
+        suffix: Special tokens the tokenizer adds after the text
     """
-    Construct prompt with RAG sources embedded in user message.
-
-    Args:
-        conversation_history: Previous messages (without current message)
-        thinking_mode: Whether to enable thinking mode
-        system_prompt: System prompt text
-        formatted_sources: XML-formatted source chunks
-        current_user_message: Current user query
-
-    Returns:
-        Complete prompt string with sources embedded
-
-    Format:
-        <|im_start|>system
-        {system_prompt}<|im_end|>
-        [... conversation history ...]
-        <|im_start|>user
-        {current_user_message}
-        {formatted_sources}<|im_end|>
-        <|im_start|>assistant
-        {<think> or </think> based on thinking_mode}
+
+    prefix: Tuple[int, ...]
+    separator: Tuple[int, ...]
+    think: Tuple[int, ...]
+    no_think: Tuple[int, ...]
+    suffix: Tuple[int, ...]
+
+    def assemble(self, segments, thinking_mode: bool) -> List[int]:
+        ids = list(self.prefix)
+        for segment_ids in segments:
+            ids.extend(segment_ids)
+            ids.extend(self.separator)
+        ids.extend(self.think if thinking_mode else self.no_think)
+        ids.extend(self.suffix)
+        return ids
+
+
+# Prompt checked against whole-prompt tokenization before a tokenizer's
+# prompts are assembled from segment ids: leading/trailing whitespace,
+# blank lines and non-ASCII text at segment boundaries
+_LAYOUT_PROBE_SYSTEM = "Tu es un assistant utile."
+_LAYOUT_PROBE_MESSAGES: List[ConversationMessage] = [
+    {"role": "user", "content": " Bonjour,\n\n  ça va ?"},
+    {"role": "assistant", "content": "Très bien. 42 "},
+]
+
+
+@functools.lru_cache(maxsize=16)
+def _get_prompt_layout(tokenizer) -> _PromptLayout | None:
+    """Work out how segment ids join into a prompt, or None if they don't.
+
+    Concatenating per-segment ids only reproduces tokenizing the joined
+    string when the tokenizer splits the chat tags out as special tokens, so
+    each segment is encoded independently. Tokenizers where that fails
+    (tags that are not added tokens, prefix-space schemes) get None and
+    callers tokenize the prompt string instead.
     """
-    print(f"\n{'=' * 80}")
-    print("🔍 RAG: format_prompt_with_rag() FUNCTION EXECUTION")
-    print(f"{'=' * 80}")
-    print("📥 Input parameters:")
-    print(f"  - thinking_mode: {thinking_mode} (type: {type(thinking_mode).__name__})")
-    print(
-        f"  - system_prompt: {'Present' if system_prompt else 'None'} ({len(system_prompt) if system_prompt else 0} chars)"
+    separator, think, no_think = encode_without_special_tokens(
+        tokenizer, ["\n", THINK_PREFIX, NO_THINK_PREFIX]
     )
-    print(f"  - conversation_history count: {len(conversation_history)}")
-    print(f"  - formatted_sources length: {len(formatted_sources)} chars")
-    print(f"  - current_user_message length: {len(current_user_message)} chars")
+    segments = [
+        get_system_prompt_token_ids(tokenizer, _LAYOUT_PROBE_SYSTEM),
+        *encode_without_special_tokens(
+            tokenizer, list(map(_format_message_segment, _LAYOUT_PROBE_MESSAGES))
+        ),
+    ]
+    for thinking_mode in (True, False):
+        prompt = _build_prompt(
+            _LAYOUT_PROBE_MESSAGES, thinking_mode, _LAYOUT_PROBE_SYSTEM
+        )
+        bare = encode_without_special_tokens(tokenizer, [prompt])[0]
+        full = tokenizer(prompt).input_ids
+        # Locate the text ids inside the ids with special tokens added
+        start = next(
+            (
+                k
+                for k in range(len(full) - len(bare) + 1)
+                if full[k : k + len(bare)] == bare
+            ),
+            None,
+        )
+        if start is None:
+            return None
+        layout = _PromptLayout(
+            prefix=tuple(full[:start]),
+            separator=tuple(separator),
+            think=tuple(think),
+            no_think=tuple(no_think),
+            suffix=tuple(full[start + len(bare) :]),
+        )
+        if layout.assemble(segments, thinking_mode) != full:
+            logger.info(
+                "ℹ️  %s: prompt ids are not assembled from segments",
+                tokenizer_identity(tokenizer),
+            )
+            return None
+    return layout
 
-    segments = []
 
-    # Prepend system message if provided
+def format_prompt_ids(
+    tokenizer,
+    messages: List[ConversationMessage],
+    thinking_mode: bool = True,
+    system_prompt: str | None = None,
+    cache_last: bool = True,
+) -> List[int] | None:
+    """Prompt token ids assembled from cached segment ids, without a full pass.
+
+    Equivalent to tokenizing format_prompt(messages, ...), but history
+    segments come from the same per-message cache truncate_history fills,
+    so only segments not seen before are encoded. Pass cache_last=False
+    when the last message is one-off (e.g. carries RAG sources) to keep it
+    out of the cache. Returns None for tokenizers whose prompts cannot be
+    assembled this way; tokenize the prompt string for those.
+    """
+    layout = _get_prompt_layout(tokenizer)
+    if layout is None:
+        return None
+
+    cached = messages if cache_last else messages[:-1]
+    segments = get_segment_token_ids(tokenizer, cached)
+    if not cache_last and messages:
+        segments.extend(
+            encode_without_special_tokens(
+                tokenizer, [_format_message_segment(messages[-1])]
+            )
+        )
     if system_prompt:
-        system_segment = f"<|im_start|>system\n{system_prompt}<|im_end|>"
-        segments.append(system_segment)
-        print("\n📋 System prompt segment added")
+        segments.insert(0, get_system_prompt_token_ids(tokenizer, system_prompt))
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "🔍 format_prompt_ids: thinking_mode=%s, system_prompt=%d chars, messages=%d",
+            thinking_mode,
+            len(system_prompt) if system_prompt else 0,
+            len(messages),
+        )
+        logger.debug(
+            "📝 PROMPT SENT TO MODEL:\n%s",
+            _build_prompt(messages, thinking_mode, system_prompt),
+        )
 
-    # Add conversation history (without current message)
-    for message in conversation_history:
-        formatted_msg = _format_message_segment(message)
-        segments.append(formatted_msg)
+    return layout.assemble(segments, thinking_mode)
 
-    # Current user message with embedded sources
-    user_message_with_sources = f"{current_user_message}\n{formatted_sources}"
-    user_segment = f"<|im_start|>user\n{user_message_with_sources}<|im_end|>"
-    segments.append(user_segment)
-    print(f"\n📄 User message with RAG sources added ({len(user_segment)} chars)")
 
-    # Assistant prefix with thinking mode
-    assistant_prefix = "<|im_start|>assistant\n"
-    assistant_prefix += "<think>\n" if thinking_mode else "</think>\n"
-    segments.append(assistant_prefix)
+def format_prompt(
+    messages: List[ConversationMessage],
+    thinking_mode: bool = True,
+    system_prompt: str | None = None,
+):
+    """Format the sliding-window history in Qwen instruction style with optional system prompt."""
+    prompt = _build_prompt(messages, thinking_mode, system_prompt)
+
+    # Skip building the (multi-KB) prompt dump unless debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "🔍 format_prompt: thinking_mode=%s, system_prompt=%d chars, messages=%d",
+            thinking_mode,
+            len(system_prompt) if system_prompt else 0,
+            len(messages),
+        )
+        logger.debug("📝 PROMPT SENT TO MODEL:\n%s", prompt)
 
-    prompt = "\n".join(segments)
+    return prompt
 
-    print("\n📝 RAG PROMPT SENT TO MODEL:")
-    print(f"{'─' * 80}")
-    print(prompt)
-    print(f"{'─' * 80}\n")
 
-    return prompt
+def rag_user_message(
+    current_user_message: str, formatted_sources: str
+) -> ConversationMessage:
+    """Current user message with the retrieved sources embedded."""
+    return {"role": "user", "content": f"{current_user_message}\n{formatted_sources}"}
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # Session scope lets anyio's plugin run every async test on one loop
+    return "asyncio"
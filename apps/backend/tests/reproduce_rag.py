@@ -7,7 +7,11 @@ from ..app.rag.chunker import TextChunker
 from ..app.rag.document_processor import ProcessedDocument
 from ..app.rag.embeddings import EmbeddingGenerator
 from ..app.rag.retriever import RAGRetriever
-from ..app.rag.vector_store import RetrievedChunk, VectorStore
+from ..app.rag.vector_store import (
+    RetrievedChunk,
+    VectorStore,
+    normalize_embeddings,
+)
 
 # Add backend to path
 sys.path.append(os.path.join(os.getcwd(), "apps/backend"))
@@ -110,6 +114,21 @@ Skills
             self.chunks = []
             self.embeddings = []
 
+        @property
+        def embeddings(self):
+            return self._embeddings
+
+        @embeddings.setter
+        def embeddings(self, embeddings):
+            # Unit-norm rows packed once, as VectorStore stores them
+            import numpy as np
+
+            self._embeddings = (
+                normalize_embeddings(embeddings)
+                if len(embeddings)
+                else np.empty((0, 0), dtype=np.float32)
+            )
+
         async def add_documents(self, documents):
             pass  # Not needed for this test
 
@@ -121,27 +140,23 @@ Skills
             min_similarity,
             document_id=None,
         ):
-            # Calculate cosine similarity manually
+            # Same scoring as the real NumPy scan: one batched dot product
+            # against the unit-norm matrix
             import numpy as np
-            from numpy.linalg import norm
-
-            results = []
-            for i, chunk_emb in enumerate(self.embeddings):
-                # Cosine similarity
-                sim = np.dot(query_embedding, chunk_emb) / (
-                    norm(query_embedding) * norm(chunk_emb)
-                )
 
+            sims = self._cosine_similarities(
+                np.asarray(query_embedding), self.embeddings
+            )
+            for i, sim in enumerate(sims):
                 print(f"Debug: Chunk {i} similarity: {sim:.4f}")
 
-                if sim >= 0.0:  # Return all for debugging
-                    results.append((sim, self.chunks[i]))
-
-            # Sort by similarity
-            results.sort(key=lambda x: x[0], reverse=True)
-
-            # Filter by top_k
-            return [r[1] for r in results[:top_k]]
+            # Top-k by similarity (all non-negative ones, for debugging)
+            k = min(top_k, len(sims))
+            if k == 0:
+                return []
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top])]
+            return [self.chunks[i] for i in top if sims[i] >= 0.0]
 
     vector_store = MockVectorStore()
     vector_store.chunks = [
@@ -1,7 +1,12 @@
-from docling.chunking import HybridChunker
+import pytest
 
 
+@pytest.mark.slow
 def test_docling_chunking():
+    # Imported here so collecting the suite doesn't pay for Docling (and the
+    # torch/transformers stack behind it)
+    HybridChunker = pytest.importorskip("docling.chunking").HybridChunker
+
     # Create a dummy document or load one
     # Since we can't easily create a DoclingDocument from scratch without a file,
     # we will check if we can instantiate the chunker and what it expects.
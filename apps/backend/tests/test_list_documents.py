@@ -3,76 +3,62 @@
 import asyncio
 
 import httpx
+import pytest
 from sqlalchemy import select
 
 from app.db.models import Client, Conversation, Document
 from app.db.session import async_session
+from app.main import app
 
 
+@pytest.mark.anyio
+@pytest.mark.integration
 async def test_list_documents():
-    """Test the document listing endpoint."""
-    base_url = "http://localhost:8000"
-
+    """Test the document listing endpoint (needs a populated database)."""
     # First, get a real conversation with documents from the database
     async with async_session() as session:
-        # Find a document and its conversation
-        doc_result = await session.execute(select(Document).limit(1))
-        document = doc_result.scalar_one_or_none()
-
-        if not document:
-            print("❌ No documents found in database")
-            return
-
-        conversation_id = document.conversation_id
-        print(f"Testing with conversation: {conversation_id}")
-
-        # Get the conversation to find the client
-        conv_result = await session.execute(
-            select(Conversation).where(Conversation.id == conversation_id)
+        # Find a document with its conversation and client in one query
+        result = await session.execute(
+            select(Document.conversation_id, Client.fingerprint)
+            .join(Conversation, Document.conversation_id == Conversation.id)
+            .join(Client, Conversation.client_id == Client.id)
+            .limit(1)
         )
-        conversation = conv_result.scalar_one_or_none()
+        row = result.first()
+        assert row, "No documents with a conversation and client found in database"
 
-        if not conversation:
-            print("❌ Conversation not found")
-            return
-
-        # Get the client
-        client_result = await session.execute(
-            select(Client).where(Client.id == conversation.client_id)
-        )
-        client = client_result.scalar_one_or_none()
-
-        if not client:
-            print("❌ Client not found")
-            return
+        conversation_id = row.conversation_id
+        print(f"Testing with conversation: {conversation_id}")
 
-        client_id = client.fingerprint
+        client_id = row.fingerprint
         print(f"Using client: {client_id}")
 
-    # Now test the endpoint
-    async with httpx.AsyncClient() as http_client:
+    # Now test the endpoint, calling the app in-process (lifespan not run,
+    # so no models are loaded)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as http_client:
         # Test listing documents
         response = await http_client.get(
-            f"{base_url}/api/conversations/{conversation_id}/documents",
+            f"/api/conversations/{conversation_id}/documents",
             params={"client_id": client_id},
         )
 
         print(f"\nStatus: {response.status_code}")
 
-        if response.status_code == 200:
-            documents = response.json()
-            print(f"✅ Successfully retrieved {len(documents)} document(s)")
-            for doc in documents:
-                print(f"  - {doc['filename']}")
-                print(f"    ID: {doc['id']}")
-                print(f"    Status: {doc['status']}")
-                print(f"    Chunks: {doc['chunk_count']}")
-                print(f"    Uploaded: {doc['upload_timestamp']}")
-                if doc.get("error_message"):
-                    print(f"    Error: {doc['error_message']}")
-        else:
-            print(f"❌ Failed with status {response.status_code}")
-            print(f"Response: {response.json()}")
+        assert response.status_code == 200, (
+            f"Failed with status {response.status_code}: {response.text}"
+        )
+        documents = response.json()
+        print(f"✅ Successfully retrieved {len(documents)} document(s)")
+        for doc in documents:
+            print(f"  - {doc['filename']}")
+            print(f"    ID: {doc['id']}")
+            print(f"    Status: {doc['status']}")
+            print(f"    Chunks: {doc['chunk_count']}")
+            print(f"    Uploaded: {doc['upload_timestamp']}")
+            if doc.get("error_message"):
+                print(f"    Error: {doc['error_message']}")
 
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@ import asyncio
 import sys
 from pathlib import Path
 
+import pytest
 from sqlalchemy import select
 
 from app.db.models import Client, Conversation, Document
@@ -15,29 +16,22 @@ if str(BACKEND_ROOT) not in sys.path:
     sys.path.append(str(BACKEND_ROOT))
 
 
+@pytest.mark.anyio
+@pytest.mark.integration
 async def test_list_documents():
-    """Test that we can query documents for a conversation."""
+    """Test that we can query documents for a conversation (needs a populated DB)."""
     async with async_session() as session:
-        # Get first client
-        result = await session.execute(select(Client).limit(1))
-        client = result.scalar_one_or_none()
-
-        if not client:
-            print("❌ No clients found in database")
-            return
-
-        print(f"✅ Found client: {client.fingerprint}")
-
-        # Get first conversation for this client
+        # Get the first client that has a conversation, with that conversation
         result = await session.execute(
-            select(Conversation).where(Conversation.client_id == client.id).limit(1)
+            select(Client, Conversation)
+            .join(Conversation, Conversation.client_id == Client.id)
+            .limit(1)
         )
-        conversation = result.scalar_one_or_none()
-
-        if not conversation:
-            print("❌ No conversations found for client")
-            return
+        row = result.first()
+        assert row, "No clients with conversations found in database"
 
+        client, conversation = row
+        print(f"✅ Found client: {client.fingerprint}")
         print(f"✅ Found conversation: {conversation.id}")
 
         # Query documents for this conversation
@@ -3,8 +3,9 @@ import { useQueryClient } from '@tanstack/react-query'
 import { useChatStore } from '../state/store/chatStore'
 
 interface WebSocketMessage {
-  type: 'start' | 'thinking' | 'token' | 'complete' | 'error' | 'reclassify_thinking_as_response'
+  type: 'start' | 'warming' | 'queued' | 'thinking' | 'token' | 'complete' | 'error' | 'reclassify_thinking_as_response'
   conversation_id?: string
+  model?: string
   content?: string
   message?: string
 }
@@ -81,7 +82,13 @@ export function useWebSocketManager() {
         }
         
         // Route message to correct conversation
-        if (data.type === 'start') {
+        if (data.type === 'warming') {
+          // Model is still loading on the server; 'start' follows once it is ready
+          console.log(`[WebSocket] Model ${data.model} is warming up for conversation: ${conversationId}`)
+        } else if (data.type === 'queued') {
+          // Every generation slot for the model is busy; sent before 'start', and tokens follow once one frees up
+          console.log(`[WebSocket] Waiting for a free ${data.model} generation slot for conversation: ${conversationId}`)
+        } else if (data.type === 'start') {
           connectionLostHandledRef.current = false
           startStreaming(conversationId)
         } else if (data.type === 'thinking') {